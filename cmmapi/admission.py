@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from django.conf import settings
+from django.utils import timezone
+from celery import current_app
+from celery.states import READY_STATES
+from lms.djangoapps.instructor_task.models import InstructorTask, PROGRESS, QUEUING
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .cache import TTLCache
+from datetime import timedelta
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+queue_length_cache = TTLCache('cmmapi.queue_length', maxsize=16, timeout=10)
+
+
+class TaskAdmissionError(APIException):
+    """
+        A CMM task was not submitted because of the backlog, DRF answers with the status code and Retry-After
+    """
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    default_code = 'task_admission'
+
+    def __init__(self, message, wait, status_code=None):
+        self.wait = wait
+        if status_code is not None:
+            self.status_code = status_code
+        super(TaskAdmissionError, self).__init__(message)
+        # plain dict so estimated_wait stays a number in the response
+        self.detail = {'error': message, 'estimated_wait': wait}
+
+def get_active_tasks_count():
+    """
+        CMM tasks queuing or in progress, tasks not updated in CMM_API_ADMISSION_STALE_AFTER seconds are ignored
+    """
+    from .utils import TASK_TYPES
+    stale_after = getattr(settings, 'CMM_API_ADMISSION_STALE_AFTER', 3600)
+    return InstructorTask.objects.filter(
+        task_type__in=TASK_TYPES,
+        task_state__in=[QUEUING, PROGRESS],
+        updated__gte=timezone.now() - timedelta(seconds=stale_after)).count()
+
+def get_average_task_duration():
+    """
+        Average seconds of the last finished CMM tasks, CMM_API_ADMISSION_DEFAULT_DURATION if there are none
+    """
+    from .utils import TASK_TYPES
+    finished = InstructorTask.objects.filter(task_type__in=TASK_TYPES, task_state__in=READY_STATES).exclude(
+        created=None).order_by('-id').values_list('created', 'updated')[:20]
+    durations = [(updated - created).total_seconds() for created, updated in finished]
+    if not durations:
+        return getattr(settings, 'CMM_API_ADMISSION_DEFAULT_DURATION', 60)
+    return max(sum(durations) / len(durations), 1)
+
+def get_queue_length(queue):
+    """
+        Messages waiting in the broker queue, None if the broker does not tell.
+        Cached for a few seconds so the broker is not asked on every request.
+    """
+    length = queue_length_cache.get(queue)
+    if length is not None:
+        return length
+    try:
+        with current_app.connection_for_read() as connection:
+            length = connection.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception as e:
+        logger.warning("CMMApi - Admission - Could not read the length of queue {}: {}".format(queue, e))
+        return None
+    queue_length_cache.set(queue, length)
+    return length
+
+def check_task_admission(task_type, task_key):
+    """
+        Raise TaskAdmissionError if there are too many CMM tasks queuing or in progress (429)
+        or the broker queue is too long (503). A task with the same key already in flight
+        is let through, submit_task answers it with AlreadyRunningError.
+    """
+    if InstructorTask.objects.filter(task_type=task_type, task_key=task_key).exclude(task_state__in=READY_STATES).exists():
+        return
+    max_active = getattr(settings, 'CMM_API_MAX_ACTIVE_TASKS', None)
+    if max_active:
+        active = get_active_tasks_count()
+        if active >= max_active:
+            # tasks run in parallel, one slot is free every average duration / max_active
+            wait = math.ceil(get_average_task_duration() * (active - max_active + 1) / max_active)
+            logger.info("CMMApi - Admission - Too many active tasks: {}, task_type: {}, wait: {}".format(active, task_type, wait))
+            raise TaskAdmissionError(u"Too many reports in progress, try again later", wait)
+    max_queue_length = getattr(settings, 'CMM_API_MAX_QUEUE_LENGTH', None)
+    if max_queue_length:
+        queue = getattr(settings, 'CMM_API_ADMISSION_QUEUE', 'edx.lms.core.low')
+        length = get_queue_length(queue)
+        if length is not None and length >= max_queue_length:
+            wait = math.ceil(getattr(settings, 'CMM_API_ADMISSION_QUEUE_WAIT', 60) * length / max_queue_length)
+            logger.info("CMMApi - Admission - Queue {} too long: {}, task_type: {}, wait: {}".format(queue, length, task_type, wait))
+            raise TaskAdmissionError(u"Task queue is full, try again later", wait, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -1,4 +1,7 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 from openedx.core.djangoapps.plugins.constants import (
     PluginSettings,
     PluginURLs,
@@ -26,3 +29,12 @@ class CMMAPIConfig(AppConfig):
                     PluginSettings.RELATIVE_PATH: "settings.common"}},
         },
     }
+
+    def ready(self):
+        from . import course_signals, role_signals  # pylint: disable=unused-import
+        # the report tasks and their signals need the LMS apps, they are loaded everywhere except Studio
+        service_variant = getattr(settings, 'SERVICE_VARIANT', None) or os.environ.get('SERVICE_VARIANT')
+        if service_variant != 'cms':
+            from .task import detect_edxlogin
+            from . import signals  # pylint: disable=unused-import
+            detect_edxlogin()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from django.conf import settings
+from django.core.cache import caches
+from collections import OrderedDict
+from threading import Lock
+from time import time
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TTLCache(object):
+    """
+        Process-local LRU cache with per entry expiration.
+        If backend_alias is a django cache alias, values are also shared through it.
+    """
+    def __init__(self, prefix, maxsize=1024, timeout=300, backend_alias=None):
+        self.prefix = prefix
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.backend_alias = backend_alias
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def _backend(self):
+        if self.backend_alias:
+            return caches[self.backend_alias]
+        return None
+
+    def _backend_key(self, key):
+        # memcached keys must be short and without spaces
+        return '{}.{}'.format(self.prefix, hashlib.md5(str(key).encode('utf-8')).hexdigest())
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires > time():
+                    self._data.move_to_end(key)
+                    return value
+                del self._data[key]
+        backend = self._backend()
+        if backend is not None:
+            item = backend.get(self._backend_key(key))
+            if item is not None:
+                value, expires = item
+                self._set_local(key, value, expires)
+                return value
+        return default
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        expires = time() + timeout
+        self._set_local(key, value, expires)
+        backend = self._backend()
+        if backend is not None:
+            backend.set(self._backend_key(key), (value, expires), timeout)
+
+    def _set_local(self, key, value, expires):
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        backend = self._backend()
+        if backend is not None:
+            backend.delete(self._backend_key(key))
+
+    def clear(self):
+        """
+            Only clear the process-local entries
+        """
+        with self._lock:
+            self._data.clear()
+
+# course validation and profile report columns, in this module so Studio can invalidate them
+course_exists_cache = TTLCache(
+    'cmmapi.course_exists',
+    maxsize=getattr(settings, 'CMM_API_COURSE_CACHE_SIZE', 1024),
+    timeout=getattr(settings, 'CMM_API_COURSE_CACHE_TIMEOUT', 300),
+    backend_alias=getattr(settings, 'CMM_API_VALIDATION_CACHE', None))
+
+# profile report columns by site of each course, invalidated when the course is published
+student_features_cache = TTLCache(
+    'cmmapi.student_features',
+    maxsize=getattr(settings, 'CMM_API_COURSE_CACHE_SIZE', 1024),
+    timeout=getattr(settings, 'CMM_API_FEATURES_CACHE_TIMEOUT', 300),
+    backend_alias=getattr(settings, 'CMM_API_VALIDATION_CACHE', None))
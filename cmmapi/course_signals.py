@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from django.dispatch import receiver
+from xmodule.modulestore.django import SignalHandler
+from .cache import course_exists_cache, student_features_cache
+
+# Courses are published and deleted in Studio, these receivers are connected in the LMS and the CMS
+
+@receiver(SignalHandler.course_published)
+def invalidate_course_published(sender, course_key, **kwargs):
+    """
+        Drop the cached validation and profile report columns of a published course
+    """
+    course_exists_cache.delete(str(course_key))
+    student_features_cache.delete(str(course_key))
+
+@receiver(SignalHandler.course_deleted)
+def invalidate_course_deleted(sender, course_key, **kwargs):
+    """
+        Drop the cached validation and profile report columns of a deleted course
+    """
+    course_exists_cache.delete(str(course_key))
+    student_features_cache.delete(str(course_key))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from django.core.management.base import BaseCommand
+from opaque_keys.edx.keys import CourseKey
+from common.djangoapps.student.models import CourseAccessRole, CourseEnrollment
+from cmmapi.task import backfill_roster
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the CMMCourseRoster table of the given courses, or of every course with enrollments or roles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', help='Course ids to rebuild')
+
+    def handle(self, *args, **options):
+        if options['course_ids']:
+            course_keys = [CourseKey.from_string(x) for x in options['course_ids']]
+        else:
+            course_keys = sorted(
+                set(CourseEnrollment.objects.values_list('course_id', flat=True).distinct()) |
+                set(CourseAccessRole.objects.exclude(course_id=None).values_list('course_id', flat=True).distinct()),
+                key=str)
+        for course_key in course_keys:
+            total = backfill_roster(course_key)
+            logger.info("CMMApi - Roster backfilled, course: {}, rows: {}".format(course_key, total))
+            self.stdout.write('{}: {}'.format(course_key, total))
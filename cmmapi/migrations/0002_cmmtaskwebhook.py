@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmmapi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CMMTaskWebhook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(db_index=True, max_length=255)),
+                ('url', models.URLField(max_length=1000)),
+                ('state', models.CharField(choices=[('waiting', 'Waiting task'), ('pending', 'Pending delivery'), ('delivered', 'Delivered'), ('failed', 'Failed')], default='waiting', max_length=20)),
+                ('payload', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='cmmtaskwebhook',
+            index_together={('state', 'next_attempt')},
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import opaque_keys.edx.django.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cmmapi', '0002_cmmtaskwebhook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CMMRoleChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_id', opaque_keys.edx.django.models.CourseKeyField(max_length=255)),
+                ('role', models.CharField(max_length=64)),
+                ('action', models.CharField(choices=[('added', 'Added'), ('removed', 'Removed')], max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='cmmrolechange',
+            index_together={('course_id', 'created')},
+        ),
+    ]
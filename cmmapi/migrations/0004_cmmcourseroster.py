@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import opaque_keys.edx.django.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cmmapi', '0003_cmmrolechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CMMCourseRoster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_id', opaque_keys.edx.django.models.CourseKeyField(max_length=255)),
+                ('username', models.CharField(max_length=150)),
+                ('email', models.CharField(max_length=254)),
+                ('run', models.CharField(blank=True, default='', max_length=64)),
+                ('role', models.CharField(max_length=20)),
+                ('is_enrolled', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='cmmcourseroster',
+            unique_together={('course_id', 'user')},
+        ),
+        migrations.AlterIndexTogether(
+            name='cmmcourseroster',
+            index_together={('course_id', 'role', 'username')},
+        ),
+    ]
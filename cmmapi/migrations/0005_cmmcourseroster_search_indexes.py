@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmmapi', '0004_cmmcourseroster'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='cmmcourseroster',
+            index_together={('course_id', 'role', 'username'), ('course_id', 'username'), ('course_id', 'email'), ('course_id', 'run')},
+        ),
+    ]
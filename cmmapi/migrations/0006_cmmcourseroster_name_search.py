@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmmapi', '0005_cmmcourseroster_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cmmcourseroster',
+            name='name_search',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
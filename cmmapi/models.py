@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from django.contrib.auth.models import User
+from django.db import models
+from opaque_keys.edx.django.models import CourseKeyField
+
+
+class CMMReport(models.Model):
+    """
+        Index of the report files stored by CMM tasks, so the storage does not have to be listed
+    """
+    course_id = CourseKeyField(max_length=255)
+    report_name = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('course_id', 'report_name')
+
+    @classmethod
+    def index(cls, course_id, report_name):
+        cls.objects.get_or_create(course_id=course_id, report_name=report_name)
+
+
+class CMMTaskWebhook(models.Model):
+    """
+        Callback url registered for a CMM task, posted when the task finishes
+    """
+    WAITING = 'waiting'
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+    STATE_CHOICES = (
+        (WAITING, 'Waiting task'),
+        (PENDING, 'Pending delivery'),
+        (DELIVERED, 'Delivered'),
+        (FAILED, 'Failed'),
+    )
+    task_id = models.CharField(max_length=255, db_index=True)
+    url = models.URLField(max_length=1000)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=WAITING)
+    payload = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = ('state', 'next_attempt')
+
+
+class CMMRoleChange(models.Model):
+    """
+        Log of course roles added and removed, CourseAccessRole has no history.
+        Written by role_signals in the LMS and Studio, the roles are mostly changed in Studio.
+    """
+    ADDED = 'added'
+    REMOVED = 'removed'
+    ACTION_CHOICES = (
+        (ADDED, 'Added'),
+        (REMOVED, 'Removed'),
+    )
+    course_id = CourseKeyField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    role = models.CharField(max_length=64)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = ('course_id', 'created')
+
+
+class CMMCourseRoster(models.Model):
+    """
+        Denormalized users role roster of each course, kept current by the enrollment, role and user signals
+    """
+    course_id = CourseKeyField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    username = models.CharField(max_length=150)
+    email = models.CharField(max_length=254)
+    run = models.CharField(max_length=64, blank=True, default='')
+    role = models.CharField(max_length=20)
+    is_enrolled = models.BooleanField(default=False)
+    # profile name without accents in lowercase, for the accent insensitive name filter
+    name_search = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        unique_together = ('course_id', 'user')
+        index_together = (
+            ('course_id', 'role', 'username'),
+            ('course_id', 'username'),
+            ('course_id', 'email'),
+            ('course_id', 'run'),
+        )
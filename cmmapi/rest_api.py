@@ -7,11 +7,16 @@ from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import User
 from django.db import transaction
 from django.views.decorators.cache import cache_control
+from django.utils.http import parse_etags
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.throttling import UserRateThrottle
-from .serializers import CMMCourseSerializer, CMMProblemSerializer
-from .utils import get_students_features, get_status_tasks, utils_export_ora2_data, get_problem_responses, get_students_roles
+from .serializers import CMMCourseSerializer, CMMReportSerializer, CMMStudentRoleSerializer, CMMProblemSerializer, CMMStatusTaskSerializer, CMMTaskStatusSerializer, CMMBulkReportSerializer, CMMOrgRosterSerializer, CMMRosterSerializer, CMMUserCoursesSerializer
+from .utils import get_students_features, get_status_tasks, get_status_tasks_etag, wait_task_status, iter_task_status_events, submit_bulk_reports, get_org_students_roles, utils_export_ora2_data, get_problem_responses, get_students_roles, get_course_roster, iter_course_roster_ndjson, is_sync_roster_allowed, ROSTER_SEARCH_FILTERS, is_selective_roster_search, get_user_courses
+from .webhooks import register_task_webhook
+from .throttling import TokenBucketThrottle
 from openedx.core.lib.api.authentication import BearerAuthentication
 from datetime import datetime as dt
 from rest_framework import permissions
@@ -19,19 +24,16 @@ from rest_framework import status
 from opaque_keys.edx.keys import CourseKey
 from opaque_keys import InvalidKeyError
 import logging
+import json
 
 logger = logging.getLogger(__name__)
 
-class CustomUserRateThrottle(UserRateThrottle):
-    try:
-        rate= settings.CMM_API_RATE
-    except Exception:
-        rate= '1/minute'
-
 class CMMApiStudentProfile(APIView):
     authentication_classes = (BearerAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
-    throttle_classes = [CustomUserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'student-profile'
+    throttle_task_type = 'cmmapi_profile_info_csv'
 
     @transaction.non_atomic_requests
     def dispatch(self, args, **kwargs):
@@ -39,9 +41,11 @@ class CMMApiStudentProfile(APIView):
 
     def post(self, request, format=None):
         if not request.user.is_anonymous:
-            serializer = CMMCourseSerializer(data=request.data)
+            serializer = CMMReportSerializer(data=request.data)
             if serializer.is_valid():
-                response = get_students_features(request, serializer.data['course_id'])
+                response = get_students_features(request, serializer.data['course_id'], force=serializer.validated_data['force'])
+                if serializer.validated_data.get('callback_url') and 'task_id' in response:
+                    register_task_webhook(response['task_id'], serializer.validated_data['callback_url'])
                 return Response(data=response, status=status.HTTP_200_OK)
             else:
                 logger.error("CMMApi - StudentProfile - serializer is not valid")
@@ -53,7 +57,9 @@ class CMMApiStudentProfile(APIView):
 class CMMApiORA2Report(APIView):
     authentication_classes = (BearerAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
-    throttle_classes = [CustomUserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'ora2-report'
+    throttle_task_type = 'cmmapi_export_ora2_data'
 
     @transaction.non_atomic_requests
     def dispatch(self, args, **kwargs):
@@ -61,9 +67,11 @@ class CMMApiORA2Report(APIView):
 
     def post(self, request, format=None):
         if not request.user.is_anonymous:
-            serializer = CMMCourseSerializer(data=request.data)
+            serializer = CMMReportSerializer(data=request.data)
             if serializer.is_valid():
                 response = utils_export_ora2_data(request, serializer.data['course_id'])
+                if serializer.validated_data.get('callback_url') and 'task_id' in response:
+                    register_task_webhook(response['task_id'], serializer.validated_data['callback_url'])
                 return Response(data=response, status=status.HTTP_200_OK)
             else:
                 logger.error("CMMApi - ORA2 - serializer is not valid")
@@ -78,10 +86,22 @@ class CMMApiStatusTask(APIView):
 
     def get(self, request, format=None):
         if not request.user.is_anonymous:
-            serializer = CMMCourseSerializer(data=request.data)
+            serializer = CMMStatusTaskSerializer(data=request.data or request.query_params)
             if serializer.is_valid():
-                response = get_status_tasks(serializer.data['course_id'])
-                return Response(data=response, status=status.HTTP_200_OK)
+                course_id = serializer.validated_data['course_id']
+                filters = {
+                    'task_type': serializer.validated_data.get('task_type'),
+                    'task_state': serializer.validated_data.get('task_state'),
+                    'since': serializer.validated_data.get('since'),
+                    'after_id': serializer.validated_data.get('cursor'),
+                    'page_size': serializer.validated_data.get('page_size'),
+                }
+                etag = get_status_tasks_etag(course_id, **filters)
+                if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+                if etag in if_none_match or '*' in if_none_match:
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+                response = get_status_tasks(course_id, **filters)
+                return Response(data=response, status=status.HTTP_200_OK, headers={'ETag': etag})
             else:
                 logger.error("CMMApi - StatusTask - serializer is not valid")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -89,10 +109,54 @@ class CMMApiStatusTask(APIView):
             logger.error("CMMApi - StatusTask - User is Anonymous or dont have permission")
             return Response({'error': 'User dont have permission'}, status=status.HTTP_400_BAD_REQUEST)
 
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return 'event: error\ndata: {}\n\n'.format(json.dumps(data))
+
+class CMMApiTaskStatus(APIView):
+    """
+        Long-poll the status of one task, or follow it as server-sent events with 'Accept: text/event-stream'
+    """
+    authentication_classes = (BearerAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (JSONRenderer, EventStreamRenderer)
+
+    @transaction.non_atomic_requests
+    def dispatch(self, args, **kwargs):
+        return super(CMMApiTaskStatus, self).dispatch(args, **kwargs)
+
+    def get(self, request, format=None):
+        if not request.user.is_anonymous:
+            serializer = CMMTaskStatusSerializer(data=request.data or request.query_params)
+            if serializer.is_valid():
+                task_id = serializer.validated_data['task_id']
+                timeout = serializer.validated_data.get('timeout', getattr(settings, 'CMM_API_TASK_WAIT_TIMEOUT', 30))
+                if request.accepted_renderer.format == 'sse':
+                    response = StreamingHttpResponse(iter_task_status_events(task_id, timeout), content_type='text/event-stream')
+                    response['Cache-Control'] = 'no-cache'
+                    response['X-Accel-Buffering'] = 'no'
+                    return response
+                response = wait_task_status(task_id, last_state=serializer.validated_data.get('state'), timeout=timeout)
+                if response is None:
+                    return Response({'error': 'Task does not exist'}, status=status.HTTP_404_NOT_FOUND)
+                return Response(data=response, status=status.HTTP_200_OK)
+            else:
+                logger.error("CMMApi - TaskStatus - serializer is not valid")
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            logger.error("CMMApi - TaskStatus - User is Anonymous or dont have permission")
+            return Response({'error': 'User dont have permission'}, status=status.HTTP_400_BAD_REQUEST)
+
 class CMMApiProblemReport(APIView):
     authentication_classes = (BearerAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
-    throttle_classes = [CustomUserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'problem-report'
+    throttle_task_type = 'cmmapi_problem_responses_csv'
 
     @transaction.non_atomic_requests
     def dispatch(self, args, **kwargs):
@@ -102,7 +166,9 @@ class CMMApiProblemReport(APIView):
         if not request.user.is_anonymous:
             serializer = CMMProblemSerializer(data=request.data)
             if serializer.is_valid():
-                response = get_problem_responses(request, serializer.data['block_id'])
+                response = get_problem_responses(request, serializer.validated_data['block_ids'])
+                if serializer.validated_data.get('callback_url') and 'task_id' in response:
+                    register_task_webhook(response['task_id'], serializer.validated_data['callback_url'])
                 return Response(data=response, status=status.HTTP_200_OK)
             else:
                 logger.error("CMMApi - ProblemReport - serializer is not valid")
@@ -114,7 +180,9 @@ class CMMApiProblemReport(APIView):
 class CMMApiStudentRole(APIView):
     authentication_classes = (BearerAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
-    throttle_classes = [CustomUserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'users-role-report'
+    throttle_task_type = 'cmmapi_student_data'
 
     @transaction.non_atomic_requests
     def dispatch(self, args, **kwargs):
@@ -122,13 +190,159 @@ class CMMApiStudentRole(APIView):
 
     def post(self, request, format=None):
         if not request.user.is_anonymous:
-            serializer = CMMCourseSerializer(data=request.data)
+            serializer = CMMStudentRoleSerializer(data=request.data)
             if serializer.is_valid():
-                response = get_students_roles(request, serializer.data['course_id'])
+                response = get_students_roles(
+                    request,
+                    serializer.data['course_id'],
+                    force=serializer.validated_data['force'],
+                    sharded=serializer.validated_data['sharded'],
+                    since=serializer.validated_data.get('since'),
+                    output_format=serializer.validated_data['output_format'])
+                if serializer.validated_data.get('callback_url') and 'task_id' in response:
+                    register_task_webhook(response['task_id'], serializer.validated_data['callback_url'])
                 return Response(data=response, status=status.HTTP_200_OK)
             else:
                 logger.error("CMMApi - StudentRole - serializer is not valid")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         else:
             logger.error("CMMApi - StudentRole - User is Anonymous or dont have permission")
-            return Response({'error': 'User dont have permission'}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': 'User dont have permission'}, status=status.HTTP_400_BAD_REQUEST)
+
+class CMMApiBulkReport(APIView):
+    """
+        Submit one report type for many courses, the throttle is charged once per request
+    """
+    authentication_classes = (BearerAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'bulk-report'
+
+    @transaction.non_atomic_requests
+    def dispatch(self, args, **kwargs):
+        return super(CMMApiBulkReport, self).dispatch(args, **kwargs)
+
+    def post(self, request, format=None):
+        if not request.user.is_anonymous:
+            serializer = CMMBulkReportSerializer(data=request.data)
+            if serializer.is_valid():
+                response = submit_bulk_reports(
+                    request,
+                    serializer.validated_data['course_ids'],
+                    serializer.validated_data['report_type'],
+                    force=serializer.validated_data['force'])
+                return Response(data=response, status=status.HTTP_200_OK)
+            else:
+                logger.error("CMMApi - BulkReport - serializer is not valid")
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            logger.error("CMMApi - BulkReport - User is Anonymous or dont have permission")
+            return Response({'error': 'User dont have permission'}, status=status.HTTP_400_BAD_REQUEST)
+
+class CMMApiOrgRosterReport(APIView):
+    """
+        Users role report of every course of an org (or a list of courses) in one CSV
+    """
+    authentication_classes = (BearerAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'org-roster-report'
+
+    @transaction.non_atomic_requests
+    def dispatch(self, args, **kwargs):
+        return super(CMMApiOrgRosterReport, self).dispatch(args, **kwargs)
+
+    def post(self, request, format=None):
+        if not request.user.is_anonymous:
+            serializer = CMMOrgRosterSerializer(data=request.data)
+            if serializer.is_valid():
+                response = get_org_students_roles(
+                    request,
+                    serializer.validated_data['org'],
+                    serializer.validated_data.get('course_ids'),
+                    output_format=serializer.validated_data['output_format'])
+                if serializer.validated_data.get('callback_url') and 'task_id' in response:
+                    register_task_webhook(response['task_id'], serializer.validated_data['callback_url'])
+                return Response(data=response, status=status.HTTP_200_OK)
+            else:
+                logger.error("CMMApi - OrgRosterReport - serializer is not valid")
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            logger.error("CMMApi - OrgRosterReport - User is Anonymous or dont have permission")
+            return Response({'error': 'User dont have permission'}, status=status.HTTP_400_BAD_REQUEST)
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data) + '\n'
+
+class CMMApiUsersRole(APIView):
+    """
+        Users role rows of a small course in the request, as keyset paginated json or streamed ndjson ('?format=ndjson').
+        Lookups by username, email, run or name are allowed on any course.
+    """
+    authentication_classes = (BearerAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (JSONRenderer, NDJSONRenderer)
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'users-role'
+    throttle_default_rate = {'rate': '60/minute', 'burst': 60}
+
+    def get(self, request, format=None):
+        if not request.user.is_anonymous:
+            serializer = CMMRosterSerializer(data=request.data or request.query_params)
+            if serializer.is_valid():
+                course_id = serializer.validated_data['course_id']
+                search = {k: serializer.validated_data[k] for k in ROSTER_SEARCH_FILTERS if k in serializer.validated_data}
+                # lookups by user are served for any course size
+                if not is_selective_roster_search(search) and not is_sync_roster_allowed(course_id):
+                    logger.info("CMMApi - UsersRole - Course too large to serve in the request: {}".format(course_id))
+                    return Response({
+                        'error': 'Course too large, use users-role-report',
+                        'report_url': request.build_absolute_uri(reverse('cmmapi:users-role-report')),
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                if request.accepted_renderer.format == 'ndjson':
+                    return StreamingHttpResponse(iter_course_roster_ndjson(course_id, **search), content_type='application/x-ndjson')
+                response = get_course_roster(
+                    course_id,
+                    after_username=serializer.validated_data.get('cursor'),
+                    page_size=serializer.validated_data.get('page_size'),
+                    **search)
+                return Response(data=response, status=status.HTTP_200_OK)
+            else:
+                logger.error("CMMApi - UsersRole - serializer is not valid")
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            logger.error("CMMApi - UsersRole - User is Anonymous or dont have permission")
+            return Response({'error': 'User dont have permission'}, status=status.HTTP_400_BAD_REQUEST)
+
+class CMMApiUserCourses(APIView):
+    """
+        Courses where a user (by username, email or run) has role or active enrollment
+    """
+    authentication_classes = (BearerAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'user-courses'
+    throttle_default_rate = {'rate': '60/minute', 'burst': 60}
+
+    def get(self, request, format=None):
+        if not request.user.is_anonymous:
+            serializer = CMMUserCoursesSerializer(data=request.data or request.query_params)
+            if serializer.is_valid():
+                response = get_user_courses(
+                    username=serializer.validated_data.get('username'),
+                    email=serializer.validated_data.get('email'),
+                    run=serializer.validated_data.get('run'),
+                    after_course_key=serializer.validated_data.get('cursor'),
+                    page_size=serializer.validated_data.get('page_size'))
+                return Response(data=response, status=status.HTTP_200_OK)
+            else:
+                logger.error("CMMApi - UserCourses - serializer is not valid")
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            logger.error("CMMApi - UserCourses - User is Anonymous or dont have permission")
+            return Response({'error': 'User dont have permission'}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from common.djangoapps.student.models import CourseAccessRole
+from .models import CMMRoleChange
+
+# Course roles are also changed in Studio, these receivers are connected in the LMS and the CMS
+
+def queue_roster_refresh(course_key, user_id):
+    """
+        Refresh the roster row in a celery task once the transaction commits,
+        so enrollment and role changes do not wait for the roster query.
+        The task is queued by name, the CMS does not load cmmapi.task.
+    """
+    if not getattr(settings, 'CMM_API_USE_ROSTER_TABLE', False):
+        return
+    refresh = current_app.signature('cmmapi.task.refresh_roster_entries', args=(str(course_key), [user_id]), queue='edx.lms.core.low')
+    transaction.on_commit(refresh.apply_async)
+
+@receiver(post_save, sender=CourseAccessRole)
+def log_role_added(sender, instance, created, **kwargs):
+    """
+        Log course roles added (used by the users role delta report) and update the roster
+    """
+    if created and instance.course_id:
+        CMMRoleChange.objects.create(course_id=instance.course_id, user_id=instance.user_id, role=instance.role, action=CMMRoleChange.ADDED)
+        queue_roster_refresh(instance.course_id, instance.user_id)
+
+@receiver(post_delete, sender=CourseAccessRole)
+def log_role_removed(sender, instance, **kwargs):
+    """
+        Log course roles removed (used by the users role delta report) and update the roster
+    """
+    if instance.course_id:
+        CMMRoleChange.objects.create(course_id=instance.course_id, user_id=instance.user_id, role=instance.role, action=CMMRoleChange.REMOVED)
+        queue_roster_refresh(instance.course_id, instance.user_id)
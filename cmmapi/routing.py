@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from django.conf import settings
+from opaque_keys.edx.keys import CourseKey, UsageKey
+from common.djangoapps.student.models import CourseEnrollment
+from .cache import TTLCache
+import logging
+
+logger = logging.getLogger(__name__)
+job_size_cache = TTLCache('cmmapi.job_size', maxsize=1024, timeout=60)
+
+def estimate_job_size(task_type, course_key, task_input=None):
+    """
+        Rough size of a report job: ORA submissions for ora2 reports, problem
+        responses for problem reports (active enrollments per container block) and active enrollments for the rest
+    """
+    if not isinstance(task_input, dict):
+        task_input = {}
+    cache_key = (task_type, str(course_key), str(task_input.get('problem_locations', '')), tuple(task_input.get('course_ids') or []))
+    size = job_size_cache.get(cache_key)
+    if size is not None:
+        return size
+    if task_type == 'cmmapi_export_ora2_data':
+        from submissions.models import Submission
+        size = Submission.objects.filter(student_item__course_id=str(course_key)).count()
+    elif task_type == 'cmmapi_problem_responses_csv':
+        from lms.djangoapps.courseware.models import StudentModule
+        usage_keys = [UsageKey.from_string(x) for x in task_input.get('problem_locations', '').split(',') if x]
+        problem_keys = [x for x in usage_keys if x.block_type == 'problem']
+        containers = len(usage_keys) - len(problem_keys)
+        size = 0
+        if problem_keys:
+            size = StudentModule.objects.filter(course_id=course_key, module_state_key__in=problem_keys).count()
+        if containers:
+            # containers are expanded by the task, counting their responses would read every response
+            # of the course in the request, approximate one response of each learner per container
+            size += containers * CourseEnrollment.objects.filter(course_id=course_key, is_active=True).count()
+    elif task_type == 'cmmapi_org_student_data' and task_input.get('course_ids'):
+        course_keys = [CourseKey.from_string(x) for x in task_input['course_ids']]
+        size = CourseEnrollment.objects.filter(course_id__in=course_keys, is_active=True).count()
+    elif task_type == 'cmmapi_org_student_data':
+        size = CourseEnrollment.objects.filter(course__org=task_input.get('org'), is_active=True).count()
+    else:
+        size = CourseEnrollment.objects.filter(course_id=course_key, is_active=True).count()
+    job_size_cache.set(cache_key, size, timeout=getattr(settings, 'CMM_API_JOB_SIZE_CACHE_TIMEOUT', 60))
+    return size
+
+def get_task_route(task_type, course_key, task_input=None):
+    """
+        Queue (and priority) of the task by job size, {} keeps the default queue of the task
+    """
+    small_queue = getattr(settings, 'CMM_API_SMALL_JOB_QUEUE', None)
+    bulk_queue = getattr(settings, 'CMM_API_BULK_JOB_QUEUE', None)
+    if not small_queue or not bulk_queue:
+        return {}
+    thresholds = getattr(settings, 'CMM_API_JOB_SIZE_THRESHOLDS', {})
+    threshold = thresholds.get(task_type, thresholds.get('default', 5000))
+    size = estimate_job_size(task_type, course_key, task_input)
+    if size <= threshold:
+        options = {'queue': small_queue}
+        priority = getattr(settings, 'CMM_API_SMALL_JOB_PRIORITY', None)
+    else:
+        options = {'queue': bulk_queue}
+        priority = getattr(settings, 'CMM_API_BULK_JOB_PRIORITY', None)
+    if priority is not None:
+        options['priority'] = priority
+    logger.info("CMMApi - Routing task {} of {}, size: {}, options: {}".format(task_type, course_key, size, options))
+    return options
+
+def route_task(task_class, task_type, course_key, task_input=None):
+    """
+        Task to give to submit_task: a signature with the routing options, submit_task calls its apply_async
+    """
+    options = get_task_route(task_type, course_key, task_input)
+    if not options:
+        return task_class
+    return task_class.s().set(**options)
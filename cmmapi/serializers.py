@@ -2,10 +2,22 @@ from opaque_keys import InvalidKeyError
 from opaque_keys.edx.keys import CourseKey, UsageKey
 from opaque_keys import InvalidKeyError
 from rest_framework import serializers
-from .utils import validate_course, validate_block
+from django.conf import settings
+from .utils import validate_course, validate_courses, validate_block, decode_task_cursor, decode_roster_cursor, decode_course_cursor, TASK_TYPES, BULK_REPORTS
+from .task import ROLE_STAFF, ROLE_STUDENT, get_report_formats
+from .webhooks import is_callback_url_allowed
+from collections import OrderedDict
 import logging
 logger = logging.getLogger(__name__)
 
+class CMMCallbackURLField(serializers.URLField):
+    def to_internal_value(self, data):
+        url = super(CMMCallbackURLField, self).to_internal_value(data)
+        if not is_callback_url_allowed(url):
+            logger.error('CMMCallbackURLField - Callback url not allowed: {}'.format(url))
+            raise serializers.ValidationError(u"Callback url not allowed: {}".format(url))
+        return url
+
 class CMMCourseSerializer(serializers.Serializer):
     course_id = serializers.CharField(required=True, allow_blank=False)
 
@@ -16,8 +28,90 @@ class CMMCourseSerializer(serializers.Serializer):
             raise serializers.ValidationError(u"Course key not valid or dont exists: {}".format(course_id))
         return course_id
 
+class CMMReportSerializer(CMMCourseSerializer):
+    callback_url = CMMCallbackURLField(required=False, allow_blank=False)
+    force = serializers.BooleanField(required=False, default=False)
+
+class CMMStudentRoleSerializer(CMMReportSerializer):
+    sharded = serializers.BooleanField(required=False, default=False)
+    since = serializers.DateTimeField(required=False)
+    output_format = serializers.ChoiceField(choices=get_report_formats(), required=False, default='csv')
+
+class CMMStatusTaskSerializer(CMMCourseSerializer):
+    task_type = serializers.ChoiceField(choices=TASK_TYPES, required=False)
+    task_state = serializers.CharField(required=False, allow_blank=False)
+    since = serializers.DateTimeField(required=False)
+    cursor = serializers.CharField(required=False, allow_blank=False)
+    page_size = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_cursor(self, value):
+        try:
+            return decode_task_cursor(value)
+        except ValueError:
+            logger.error('CMMStatusTaskSerializer - Cursor not valid: {}'.format(value))
+            raise serializers.ValidationError(u"Cursor not valid: {}".format(value))
+
+    def validate_page_size(self, value):
+        return min(value, getattr(settings, 'CMM_API_STATUS_MAX_PAGE_SIZE', 500))
+
+class CMMRosterSerializer(CMMCourseSerializer):
+    cursor = serializers.CharField(required=False, allow_blank=False)
+    page_size = serializers.IntegerField(required=False, min_value=1)
+    role = serializers.ChoiceField(choices=[ROLE_STAFF, ROLE_STUDENT], required=False)
+    # BooleanField reads a missing query param as False
+    is_enrolled = serializers.ChoiceField(choices=['true', 'false'], required=False)
+    username = serializers.CharField(required=False, allow_blank=False, max_length=150)
+    email = serializers.CharField(required=False, allow_blank=False, max_length=254)
+    run = serializers.CharField(required=False, allow_blank=False, max_length=64)
+    name = serializers.CharField(required=False, allow_blank=False, max_length=255)
+
+    def validate_is_enrolled(self, value):
+        return value == 'true'
+
+    def validate_cursor(self, value):
+        try:
+            return decode_roster_cursor(value)
+        except ValueError:
+            logger.error('CMMRosterSerializer - Cursor not valid: {}'.format(value))
+            raise serializers.ValidationError(u"Cursor not valid: {}".format(value))
+
+    def validate_page_size(self, value):
+        return min(value, getattr(settings, 'CMM_API_ROSTER_MAX_PAGE_SIZE', 2000))
+
+class CMMUserCoursesSerializer(serializers.Serializer):
+    username = serializers.CharField(required=False, allow_blank=False, max_length=150)
+    email = serializers.CharField(required=False, allow_blank=False, max_length=254)
+    run = serializers.CharField(required=False, allow_blank=False, max_length=64)
+    cursor = serializers.CharField(required=False, allow_blank=False)
+    page_size = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_cursor(self, value):
+        try:
+            return decode_course_cursor(value)
+        except ValueError:
+            logger.error('CMMUserCoursesSerializer - Cursor not valid: {}'.format(value))
+            raise serializers.ValidationError(u"Cursor not valid: {}".format(value))
+
+    def validate_page_size(self, value):
+        return min(value, getattr(settings, 'CMM_API_ROSTER_MAX_PAGE_SIZE', 2000))
+
+    def validate(self, data):
+        if len([x for x in ['username', 'email', 'run'] if data.get(x)]) != 1:
+            raise serializers.ValidationError(u"One of username, email or run is required")
+        return data
+
+class CMMTaskStatusSerializer(serializers.Serializer):
+    task_id = serializers.CharField(required=True, allow_blank=False)
+    state = serializers.CharField(required=False, allow_blank=False)
+    timeout = serializers.IntegerField(required=False, min_value=0)
+
+    def validate_timeout(self, value):
+        return min(value, getattr(settings, 'CMM_API_TASK_WAIT_TIMEOUT', 30))
+
 class CMMProblemSerializer(serializers.Serializer):
-    block_id = serializers.CharField(required=True, allow_blank=False)
+    block_id = serializers.CharField(required=False, allow_blank=False)
+    block_ids = serializers.ListField(child=serializers.CharField(allow_blank=False), required=False, allow_empty=False)
+    callback_url = CMMCallbackURLField(required=False, allow_blank=False)
     
     def validate_block_id(self, value):
         block_id = value
@@ -25,3 +119,63 @@ class CMMProblemSerializer(serializers.Serializer):
             logger.error('CMMProblemSerializer - Block key not valid or dont exists: {}'.format(block_id))
             raise serializers.ValidationError(u"Block key not valid or dont exists: {}".format(block_id))
         return block_id
+
+    def validate_block_ids(self, value):
+        max_blocks = getattr(settings, 'CMM_API_PROBLEM_MAX_BLOCKS', 100)
+        if len(value) > max_blocks:
+            logger.error('CMMProblemSerializer - Too many blocks: {}'.format(len(value)))
+            raise serializers.ValidationError(u"Too many blocks, max: {}".format(max_blocks))
+        block_ids = list(OrderedDict.fromkeys(value))
+        invalid = [x for x in block_ids if not validate_block(x)]
+        if invalid:
+            logger.error('CMMProblemSerializer - Block keys not valid or dont exists: {}'.format(invalid))
+            raise serializers.ValidationError(u"Block keys not valid or dont exists: {}".format(', '.join(invalid)))
+        return block_ids
+
+    def validate(self, data):
+        block_ids = list(data.get('block_ids', []))
+        if data.get('block_id') and data['block_id'] not in block_ids:
+            block_ids.insert(0, data['block_id'])
+        if not block_ids:
+            raise serializers.ValidationError(u"block_id or block_ids is required")
+        if len(set(UsageKey.from_string(x).course_key for x in block_ids)) > 1:
+            logger.error('CMMProblemSerializer - Blocks of many courses: {}'.format(block_ids))
+            raise serializers.ValidationError(u"All the blocks must belong to the same course")
+        data['block_ids'] = block_ids
+        return data
+
+class CMMBulkReportSerializer(serializers.Serializer):
+    course_ids = serializers.ListField(child=serializers.CharField(allow_blank=False), allow_empty=False)
+    report_type = serializers.ChoiceField(choices=sorted(BULK_REPORTS.keys()))
+    force = serializers.BooleanField(required=False, default=False)
+
+    def validate_course_ids(self, value):
+        max_courses = getattr(settings, 'CMM_API_BULK_MAX_COURSES', 500)
+        if len(value) > max_courses:
+            logger.error('CMMBulkReportSerializer - Too many courses: {}'.format(len(value)))
+            raise serializers.ValidationError(u"Too many courses, max: {}".format(max_courses))
+        return list(OrderedDict.fromkeys(value))
+
+class CMMOrgRosterSerializer(serializers.Serializer):
+    org = serializers.RegexField(r'^[\w\-~.:]+$', required=False)
+    course_ids = serializers.ListField(child=serializers.CharField(allow_blank=False), required=False, allow_empty=False)
+    callback_url = CMMCallbackURLField(required=False, allow_blank=False)
+    output_format = serializers.ChoiceField(choices=get_report_formats(), required=False, default='csv')
+
+    def validate_course_ids(self, value):
+        max_courses = getattr(settings, 'CMM_API_BULK_MAX_COURSES', 500)
+        if len(value) > max_courses:
+            logger.error('CMMOrgRosterSerializer - Too many courses: {}'.format(len(value)))
+            raise serializers.ValidationError(u"Too many courses, max: {}".format(max_courses))
+        valid, invalid = validate_courses(list(OrderedDict.fromkeys(value)))
+        if invalid:
+            logger.error('CMMOrgRosterSerializer - Course keys not valid or dont exists: {}'.format(invalid))
+            raise serializers.ValidationError(u"Course keys not valid or dont exists: {}".format(', '.join(invalid)))
+        return valid
+
+    def validate(self, data):
+        if not data.get('org') and not data.get('course_ids'):
+            raise serializers.ValidationError(u"org or course_ids is required")
+        if not data.get('org'):
+            data['org'] = CourseKey.from_string(data['course_ids'][0]).org
+        return data
@@ -1,2 +1,52 @@
 def plugin_settings(settings):
     settings.CMM_API_RATE = '1/minute'
+    settings.CMM_API_REPORT_CHUNK_SIZE = 2000
+    settings.CMM_API_REPORT_SPOOL_SIZE = 5 * 1024 * 1024
+    settings.CMM_API_COURSE_CACHE_SIZE = 1024
+    settings.CMM_API_COURSE_CACHE_TIMEOUT = 300
+    settings.CMM_API_COURSE_CACHE_NEGATIVE_TIMEOUT = 30
+    settings.CMM_API_VALIDATION_CACHE = None
+    settings.CMM_API_STATUS_PAGE_SIZE = 100
+    settings.CMM_API_STATUS_MAX_PAGE_SIZE = 500
+    settings.CMM_API_STATUS_ETAG_MAX_AGE = 300
+    settings.CMM_API_TASK_WAIT_TIMEOUT = 30
+    settings.CMM_API_TASK_WAIT_INTERVAL = 1
+    settings.CMM_API_TASK_WAIT_KEEP_ALIVE = 15
+    settings.CMM_API_WEBHOOK_TIMEOUT = 5
+    settings.CMM_API_WEBHOOK_BATCH_DELAY = 5
+    settings.CMM_API_WEBHOOK_BATCH_SIZE = 500
+    settings.CMM_API_WEBHOOK_MAX_ATTEMPTS = 5
+    settings.CMM_API_WEBHOOK_BACKOFF = 30
+    settings.CMM_API_WEBHOOK_CACHE = 'default'
+    settings.CMM_API_WEBHOOK_ALLOWED_HOSTS = []
+    settings.CMM_API_WEBHOOK_ALLOWED_SCHEMES = ['https']
+    settings.CMM_API_REPORT_CACHE_MAX_AGE = 600
+    settings.CMM_API_BULK_MAX_COURSES = 500
+    settings.CMM_API_ROLE_REPORT_SHARD_SIZE = 20000
+    settings.CMM_API_SMALL_JOB_QUEUE = None
+    settings.CMM_API_BULK_JOB_QUEUE = None
+    settings.CMM_API_SMALL_JOB_PRIORITY = None
+    settings.CMM_API_BULK_JOB_PRIORITY = None
+    settings.CMM_API_JOB_SIZE_THRESHOLDS = {
+        'default': 5000,
+        'cmmapi_export_ora2_data': 2000,
+        'cmmapi_problem_responses_csv': 20000,
+    }
+    settings.CMM_API_JOB_SIZE_CACHE_TIMEOUT = 60
+    settings.CMM_API_USE_ROSTER_TABLE = False
+    settings.CMM_API_SYNC_ROSTER_MAX_USERS = 2000
+    settings.CMM_API_ROSTER_PAGE_SIZE = 500
+    settings.CMM_API_ROSTER_MAX_PAGE_SIZE = 2000
+    settings.CMM_API_ROSTER_MIN_SEARCH_LENGTH = 3
+    settings.CMM_API_THROTTLE_RATES = {}
+    settings.CMM_API_THROTTLE_CACHE = 'default'
+    settings.CMM_API_THROTTLE_COST_UNIT = 5000
+    settings.CMM_API_THROTTLE_LOCK_RETRIES = 5
+    settings.CMM_API_MAX_ACTIVE_TASKS = None
+    settings.CMM_API_ADMISSION_STALE_AFTER = 3600
+    settings.CMM_API_ADMISSION_DEFAULT_DURATION = 60
+    settings.CMM_API_MAX_QUEUE_LENGTH = None
+    settings.CMM_API_ADMISSION_QUEUE = 'edx.lms.core.low'
+    settings.CMM_API_ADMISSION_QUEUE_WAIT = 60
+    settings.CMM_API_PROBLEM_MAX_BLOCKS = 100
+    settings.CMM_API_FEATURES_CACHE_TIMEOUT = 300
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from celery.signals import task_postrun
+from celery.states import SUCCESS
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from lms.djangoapps.instructor_task.models import InstructorTask
+from lms.djangoapps.instructor_task.tasks import calculate_students_features_csv, export_ora2_data, calculate_problem_responses_csv
+from common.djangoapps.student.models import CourseEnrollment, UserProfile
+from .models import CMMCourseRoster, CMMReport
+from .task import process_data, process_org_data, merge_data_shards, normalize_name
+from .role_signals import queue_roster_refresh
+from .utils import TASK_TYPES
+from .webhooks import notify_task_webhooks
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+@receiver(post_save, sender=InstructorTask)
+def index_task_report(sender, instance, **kwargs):
+    """
+        Index the report of CMM tasks (own and stock edx tasks) when they succeed
+    """
+    if instance.task_type not in TASK_TYPES or instance.task_state != SUCCESS:
+        return
+    try:
+        report_name = json.loads(instance.task_output).get('report_name')
+    except Exception:
+        return
+    if report_name:
+        CMMReport.index(instance.course_id, report_name)
+
+WEBHOOK_TASKS = set(x.name for x in [process_data, process_org_data, merge_data_shards, calculate_students_features_csv, export_ora2_data, calculate_problem_responses_csv])
+
+@task_postrun.connect
+def notify_finished_task(sender=None, args=None, **kwargs):
+    """
+        Queue the webhooks of CMM tasks, task_postrun runs after BaseInstructorTask saved the final state
+    """
+    if sender is None or sender.name not in WEBHOOK_TASKS or not args:
+        return
+    notify_task_webhooks(args[0])
+
+@receiver(post_save, sender=CourseEnrollment)
+def update_roster_enrollment(sender, instance, **kwargs):
+    """
+        Update the roster row of the user when the enrollment changes
+    """
+    queue_roster_refresh(instance.course_id, instance.user_id)
+
+@receiver(post_save, sender=User)
+def update_roster_user(sender, instance, **kwargs):
+    """
+        Copy username and email changes to the roster, rows already up to date are not written.
+        Saves that only update last_login are ignored.
+    """
+    update_fields = kwargs.get('update_fields')
+    if not getattr(settings, 'CMM_API_USE_ROSTER_TABLE', False) or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    CMMCourseRoster.objects.filter(user_id=instance.id).exclude(username=instance.username, email=instance.email).update(
+        username=instance.username,
+        email=instance.email)
+
+@receiver(post_save, sender=UserProfile)
+def update_roster_name(sender, instance, **kwargs):
+    """
+        Copy profile name changes to the normalized name of the roster
+    """
+    if not getattr(settings, 'CMM_API_USE_ROSTER_TABLE', False):
+        return
+    name_search = normalize_name(instance.name)
+    CMMCourseRoster.objects.filter(user_id=instance.user_id).exclude(name_search=name_search).update(name_search=name_search)
+
+def update_roster_run(sender, instance, **kwargs):
+    """
+        Copy run changes to the roster
+    """
+    if not getattr(settings, 'CMM_API_USE_ROSTER_TABLE', False):
+        return
+    CMMCourseRoster.objects.filter(user_id=instance.user_id).exclude(run=instance.run or '').update(run=instance.run or '')
+
+if apps.is_installed('uchileedxlogin'):
+    post_save.connect(update_roster_run, sender='uchileedxlogin.EdxLoginUser')
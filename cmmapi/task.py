@@ -4,62 +4,370 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from opaque_keys.edx.keys import CourseKey, UsageKey
-from celery import current_task, task
-from common.djangoapps.student.models import CourseAccessRole
+from opaque_keys.edx.locator import CourseLocator
+from opaque_keys.edx.django.models import CourseKeyField
+from celery import chord, current_task, task
+from celery.exceptions import Ignore
+from celery.states import FAILURE
+from common.djangoapps.student.models import CourseAccessRole, CourseEnrollment, UserProfile
 from common.djangoapps.util.file import course_filename_prefix_generator
 from lms.djangoapps.instructor_task.models import InstructorTask, ReportStore
 from lms.djangoapps.instructor_task.api_helper import submit_task
 from lms.djangoapps.instructor_task.tasks_base import BaseInstructorTask
 from lms.djangoapps.instructor_task.tasks_helper.runner import run_main_task, TaskProgress
-from django.core.exceptions import FieldError
+from .models import CMMCourseRoster, CMMReport, CMMRoleChange
+from .webhooks import notify_task_webhooks
+from .routing import route_task
+from .admission import check_task_admission
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import BooleanField, Case, CharField, Exists, F, OuterRef, Q, Value, When
+from django.db.models.functions import Coalesce
 from django.utils.translation import ugettext_noop
-from django.core.files.base import ContentFile
+from django.utils.dateparse import parse_datetime
+from django.core.files.base import File
 from functools import partial
+from itertools import islice
 from datetime import datetime as dt
 from time import time
 from pytz import UTC
 import unidecode
+import tempfile
+import gzip
 import logging
-import codecs
 import json
-import six
+import hashlib
+import heapq
+import traceback
 import csv
 import io
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 logger = logging.getLogger(__name__)
+EXECUTION_TASK_INPUT = ['sharded']
+REPORT_EXTENSIONS = {'csv': '.csv', 'gzip': '.csv.gz', 'zstd': '.csv.zst'}
+ROLE_STAFF = 'Docente/Equipo'
+ROLE_STUDENT = 'Estudiante'
+ROLES_REPORT_HEADER = ['Username', 'Email','Run', 'Rol']
+ROLES_DELTA_REPORT_HEADER = ['Username', 'Email','Run', 'Rol', 'Action']
+# set by detect_edxlogin on app ready
+EDXLOGIN_ENABLED = None
+
+def detect_edxlogin():
+    """
+        Check once if User has the uchileedxlogin 'edxloginuser' relation (called by CMMAPIConfig.ready)
+    """
+    global EDXLOGIN_ENABLED
+    try:
+        User._meta.get_field('edxloginuser')
+        EDXLOGIN_ENABLED = True
+    except FieldDoesNotExist:
+        logger.info("CMMApi - UchileEdxLogin model is not installed, Run column will be empty")
+        EDXLOGIN_ENABLED = False
+    return EDXLOGIN_ENABLED
+
+def has_edxlogin():
+    if EDXLOGIN_ENABLED is None:
+        return detect_edxlogin()
+    return EDXLOGIN_ENABLED
+
+def get_user_roles_values():
+    """
+        .values() projection used by get_user_roles
+    """
+    if has_edxlogin():
+        return ('user__username', 'user__email', 'user__edxloginuser__run')
+    return ('user__username', 'user__email')
+
+def get_run_expression(user_prefix='user__'):
+    """
+        Run of the user ('' if it has no run or uchileedxlogin is not installed)
+    """
+    if has_edxlogin():
+        return Coalesce('{}edxloginuser__run'.format(user_prefix), Value(''))
+    return Value('', output_field=CharField())
 
 def get_user_roles(course_key):
     """
         Get all user with role in the course
     """
-    try:
-        user_roles_model = list(CourseAccessRole.objects.filter(course_id=course_key).values('user__username', 'user__email','user__edxloginuser__run').distinct())
-    except FieldError:
-        logger.error("CMMApi - Error with UchileEdxLogin model")
-        user_roles_model = list(CourseAccessRole.objects.filter(course_id=course_key).values('user__username', 'user__email').distinct())
-    return user_roles_model
+    return list(CourseAccessRole.objects.filter(course_id=course_key).values(*get_user_roles_values()).distinct())
+
+def get_roster_queryset(course_keys, *args, role=None, is_enrolled=None, **kwargs):
+    """
+        Single query with every user with role or active enrollment in the courses.
+        Users with role are 'Docente/Equipo' and the rest 'Estudiante', computed by the database.
+        Extra filters must be valid for CourseEnrollment and CourseAccessRole (e.g. user_id__gte),
+        role and is_enrolled skip the part of the query that can not match.
+        course_keys None does not filter by course (the filters must select the users).
+    """
+    course_filter = {} if course_keys is None else {'course_id__in': course_keys}
+    course_roles = CourseAccessRole.objects.filter(course_id=OuterRef('course_id'), user_id=OuterRef('user_id'))
+    active_enrollments = CourseEnrollment.objects.filter(course_id=OuterRef('course_id'), user_id=OuterRef('user_id'), is_active=True)
+    parts = []
+    if is_enrolled is not False:
+        # annotations keep the same order in both parts, UNION matches the columns by position
+        enrolled_users = CourseEnrollment.objects.filter(*args, is_active=True, **course_filter, **kwargs).annotate(
+            is_enrolled=Value(True, output_field=BooleanField()),
+            has_role=Exists(course_roles),
+            username=F('user__username'),
+            email=F('user__email'),
+            run=get_run_expression(),
+        )
+        if role is not None:
+            enrolled_users = enrolled_users.filter(has_role=(role == ROLE_STAFF))
+        parts.append(enrolled_users.annotate(
+            rol=Case(When(has_role=True, then=Value(ROLE_STAFF)), default=Value(ROLE_STUDENT), output_field=CharField())
+        ).values('course_id', 'user_id', 'username', 'email', 'run', 'rol', 'is_enrolled'))
+    if is_enrolled is not True and role in (None, ROLE_STAFF):
+        # users with role and without active enrollment, UNION also removes users with many roles
+        parts.append(CourseAccessRole.objects.filter(*args, **course_filter, **kwargs).exclude(course_id=CourseKeyField.Empty).annotate(
+            is_enrolled=Exists(active_enrollments),
+            username=F('user__username'),
+            email=F('user__email'),
+            run=get_run_expression(),
+        ).filter(is_enrolled=False).annotate(
+            rol=Value(ROLE_STAFF, output_field=CharField())
+        ).values('course_id', 'user_id', 'username', 'email', 'run', 'rol', 'is_enrolled'))
+    if not parts:
+        return CourseEnrollment.objects.none()
+    if len(parts) == 1:
+        return parts[0].order_by('course_id', 'rol', 'username')
+    return parts[0].union(*parts[1:]).order_by('course_id', 'rol', 'username')
+
+def get_roster(course_keys, *args, role=None, is_enrolled=None, **kwargs):
+    """
+        Roster rows of the courses, read from the CMMCourseRoster table if CMM_API_USE_ROSTER_TABLE is set.
+        Same columns, order and filters than get_roster_queryset.
+    """
+    if not getattr(settings, 'CMM_API_USE_ROSTER_TABLE', False):
+        return get_roster_queryset(course_keys, *args, role=role, is_enrolled=is_enrolled, **kwargs)
+    roster = CMMCourseRoster.objects.filter(*args, **kwargs)
+    if course_keys is not None:
+        roster = roster.filter(course_id__in=course_keys)
+    if role is not None:
+        roster = roster.filter(role=role)
+    if is_enrolled is not None:
+        roster = roster.filter(is_enrolled=is_enrolled)
+    return roster.annotate(
+        rol=F('role'),
+    ).values('course_id', 'user_id', 'username', 'email', 'run', 'rol', 'is_enrolled').order_by('course_id', 'role', 'username')
+
+def get_user_lookup_filter(username=None, email=None, run=None):
+    """
+        Q filter of get_roster selecting one user by username, email or run
+    """
+    if username:
+        return Q(user__username=username)
+    if email:
+        return Q(user__email=email)
+    if run and has_edxlogin():
+        return Q(user__edxloginuser__run=run)
+    return Q(pk__in=[])
+
+def get_roster_search_filters(username=None, email=None, run=None, name=None):
+    """
+        Q filters of get_roster for username, email and run prefixes and an accent insensitive name.
+        They use the columns of the roster table when it is enabled, so its indexes and normalized name are used.
+    """
+    table = getattr(settings, 'CMM_API_USE_ROSTER_TABLE', False)
+    prefix = '' if table else 'user__'
+    filters = []
+    if username:
+        filters.append(Q(**{'{}username__startswith'.format(prefix): username}))
+    if email:
+        filters.append(Q(**{'{}email__startswith'.format(prefix): email}))
+    if run:
+        if table:
+            filters.append(Q(run__startswith=run))
+        elif has_edxlogin():
+            filters.append(Q(user__edxloginuser__run__startswith=run))
+        else:
+            # no user has run without uchileedxlogin
+            filters.append(Q(pk__in=[]))
+    if name:
+        if table:
+            filters.append(Q(name_search__contains=normalize_name(name)))
+        else:
+            # accents are ignored by the collation of the database (MySQL utf8 general/unicode collations)
+            filters.append(Q(user__profile__name__icontains=name) | Q(user__profile__name__icontains=unidecode.unidecode(name)))
+    return filters
+
+def normalize_name(name):
+    return unidecode.unidecode(name or '').lower()
+
+def get_roster_names(user_ids):
+    """
+        Normalized profile name of the users, by user id
+    """
+    return {
+        user_id: normalize_name(name)
+        for user_id, name in UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'name')
+    }
+
+def refresh_roster_entry(course_key, user_id):
+    """
+        Update the CMMCourseRoster row of the user in the course from the live roster query
+    """
+    row = get_roster_queryset([course_key], user_id=user_id).first()
+    if row is None:
+        CMMCourseRoster.objects.filter(course_id=course_key, user_id=user_id).delete()
+        return
+    CMMCourseRoster.objects.update_or_create(course_id=course_key, user_id=user_id, defaults={
+        'username': row['username'],
+        'email': row['email'],
+        'run': row['run'],
+        'role': row['rol'],
+        'is_enrolled': row['is_enrolled'],
+        'name_search': get_roster_names([user_id]).get(user_id, ''),
+    })
+
+@task(queue='edx.lms.core.low')
+def refresh_roster_entries(course_id, user_ids):
+    """
+        Update the CMMCourseRoster rows of the users in the course, queued by the roster signals
+    """
+    course_key = CourseKey.from_string(course_id)
+    for user_id in user_ids:
+        refresh_roster_entry(course_key, user_id)
+
+def backfill_roster(course_key, batch_size=None):
+    """
+        Rebuild the CMMCourseRoster rows of the course, returns the number of rows
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'CMM_API_REPORT_CHUNK_SIZE', 2000)
+    rows = get_roster_queryset([course_key]).iterator(chunk_size=batch_size)
+    total = 0
+    with transaction.atomic():
+        CMMCourseRoster.objects.filter(course_id=course_key).delete()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            names = get_roster_names([x['user_id'] for x in batch])
+            CMMCourseRoster.objects.bulk_create([
+                CMMCourseRoster(
+                    course_id=course_key,
+                    user_id=x['user_id'],
+                    username=x['username'],
+                    email=x['email'],
+                    run=x['run'],
+                    role=x['rol'],
+                    is_enrolled=x['is_enrolled'],
+                    name_search=names.get(x['user_id'], ''))
+                for x in batch
+            ])
+            total += len(batch)
+    return total
 
 def get_user_info_role(course_key):
-    user_roles_model = get_user_roles(course_key)
-    usernames_roles = [x['user__username'] for x in user_roles_model]
-    # try to get rut from edxloginuser model if this dont exists only get id, username and email
-    try:
-        enrolled_students = User.objects.filter(courseenrollment__course_id=course_key,courseenrollment__is_active=1).order_by('username').values('username', 'email', 'edxloginuser__run')
-        instructor_users = [[x['user__username'],x['user__email'],x['user__edxloginuser__run'] or '', 'Docente/Equipo'] for x in user_roles_model]
-        students_users = [[x['username'],x['email'],x['edxloginuser__run'] or '', 'Estudiante'] for x in enrolled_students if x['username'] not in usernames_roles]
-        return instructor_users + students_users
-    except FieldError:
-        logger.error("CMMApi - Error with UchileEdxLogin model")
-        enrolled_students = User.objects.filter(courseenrollment__course_id=course_key,courseenrollment__is_active=1).order_by('username').values('username', 'email')
-        instructor_users = [[x['user__username'],x['user__email'],'', 'Docente/Equipo'] for x in user_roles_model]
-        students_users = [[x['username'],x['email'],'', 'Estudiante'] for x in enrolled_students if x['username'] not in usernames_roles]
-        return instructor_users + students_users
-
-def task_process_data(request, course_key):
+    """
+        Get all users role report rows as a list
+    """
+    return list(iter_user_info_role(course_key))
+
+def iter_user_info_role(course_key, chunk_size=None):
+    """
+        Yield the users role report rows, reading the roster query in chunks
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'CMM_API_REPORT_CHUNK_SIZE', 2000)
+    for x in get_roster([course_key]).iterator(chunk_size=chunk_size):
+        yield [x['username'], x['email'], x['run'], x['rol']]
+
+def write_report_csv(output_buffer, header, rows):
+    """
+        Write header (if any) and rows as utf-8 csv into a binary file-like object
+    """
+    text_buffer = io.TextIOWrapper(output_buffer, encoding='utf-8', newline='')
+    csvwriter = csv.writer(text_buffer)
+    if header:
+        csvwriter.writerow(header)
+    csvwriter.writerows(rows)
+    text_buffer.flush()
+    # detach so closing the wrapper does not close the spooled file
+    text_buffer.detach()
+
+def get_report_formats():
+    """
+        Output formats of the CMM reports, zstd needs the zstandard package
+    """
+    return [x for x in ['csv', 'gzip', 'zstd'] if x != 'zstd' or zstandard is not None]
+
+def get_report_format(report_name):
+    """
+        Output format of a report file by its extension
+    """
+    for output_format in ['gzip', 'zstd']:
+        if report_name.endswith(REPORT_EXTENSIONS[output_format]):
+            return output_format
+    return 'csv'
+
+def write_report(output_buffer, header, rows, output_format='csv'):
+    """
+        Write the csv into output_buffer, compressed while the rows are written if output_format is gzip or zstd
+    """
+    if output_format == 'gzip':
+        # closing the GzipFile writes the trailer and leaves the spooled file open
+        with gzip.GzipFile(fileobj=output_buffer, mode='wb') as writer:
+            write_report_csv(writer, header, rows)
+    elif output_format == 'zstd':
+        writer = zstandard.ZstdCompressor().stream_writer(output_buffer)
+        write_report_csv(writer, header, rows)
+        # end the frame without closing the spooled file
+        writer.flush(zstandard.FLUSH_FRAME)
+    else:
+        write_report_csv(output_buffer, header, rows)
+
+def save_report_file(course_id, filename, output_buffer):
+    """
+        Upload a file to the GRADES_DOWNLOAD storage.
+        ReportStore.store reads the whole buffer in memory on python 3,
+        so the file is handed to the storage backend directly.
+    """
+    report_store = ReportStore.from_config('GRADES_DOWNLOAD')
+    output_buffer.seek(0)
+    report_store.storage.save(report_store.path_to(course_id, filename), File(output_buffer))
+
+def store_report_file(course_id, report_name, output_buffer):
+    """
+        Upload a report file and add it to the report index
+    """
+    save_report_file(course_id, report_name, output_buffer)
+    CMMReport.index(course_id, report_name)
+
+def new_report_buffer():
+    """
+        Binary temp file kept in memory until CMM_API_REPORT_SPOOL_SIZE, then spilled to disk
+    """
+    return tempfile.SpooledTemporaryFile(
+        max_size=getattr(settings, 'CMM_API_REPORT_SPOOL_SIZE', 5 * 1024 * 1024),
+        mode='w+b')
+
+def hash_task_input(task_input):
+    if isinstance(task_input, dict):
+        # options that only change how the report is generated, not its content
+        task_input = {k: v for k, v in task_input.items() if k not in EXECUTION_TASK_INPUT}
+    return hashlib.md5(json.dumps(task_input, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_student_data_task_key(course_key, task_input=None):
+    # reports with other content (since, output_format) can run at the same time, the full CSV keeps the plain key
+    content_input = {k: v for k, v in (task_input or {}).items() if k not in EXECUTION_TASK_INPUT}
+    if not content_input:
+        return "CMM-API-STUDENT-DATA-{}".format(str(course_key))
+    return "CMM-API-STUDENT-DATA-{}-{}".format(str(course_key), hash_task_input(content_input))
+
+def task_process_data(request, course_key, task_input=None):
     task_type = 'cmmapi_student_data'
-    task_class = process_data
-    task_input = {}
-    task_key = "CMM-API-STUDENT-DATA-{}".format(str(course_key))
+    task_input = task_input or {}
+    task_class = route_task(process_data, task_type, course_key, task_input)
+    task_key = get_student_data_task_key(course_key, task_input)
+    check_task_admission(task_type, task_key)
 
     return submit_task(
         request,
@@ -81,6 +389,13 @@ def generate(_xmodule_instance_args, _entry_id, course_id, task_input, action_na
     For a given `course_id`, generate a CSV file containing
     all user and role, and store using a `ReportStore`.
     """
+    output_format = task_input.get('output_format', 'csv')
+    if task_input.get('since'):
+        return generate_delta(course_id, task_input, action_name)
+    if task_input.get('sharded'):
+        shards = get_roster_shards(course_id)
+        if len(shards) > 1:
+            return generate_sharded(_entry_id, course_id, shards, action_name, output_format)
     start_time = time()
     start_date = dt.now(UTC)
     num_reports = 1
@@ -88,31 +403,329 @@ def generate(_xmodule_instance_args, _entry_id, course_id, task_input, action_na
     current_step = {'step': 'CMMAPI Student Role - Calculating students data'}
     task_progress.update_task_state(extra_meta=current_step)
     
-    data = get_user_info_role(course_id)
-    report_store = ReportStore.from_config('GRADES_DOWNLOAD')
-    csv_name = 'Reporte_Roles'
+    report_name = get_roles_report_name(course_id, start_date, output_format)
+    with new_report_buffer() as output_buffer:
+        write_report(output_buffer, ROLES_REPORT_HEADER, iter_user_info_role(course_id), output_format)
+
+        current_step = {'step': 'CMMAPI Student Role - Uploading CSV'}
+        task_progress.update_task_state(extra_meta=current_step)
+
+        store_report_file(course_id, report_name, output_buffer)
+    current_step = {
+        'step': 'CMMAPI Student Role - CSV uploaded',
+        'report_name': report_name,
+    }
+    return task_progress.update_task_state(extra_meta=current_step)
 
-    report_name = u"{course_prefix}_{csv_name}_{timestamp_str}.csv".format(
+def get_roles_report_name(course_id, start_date, output_format='csv'):
+    return u"{course_prefix}_{csv_name}_{timestamp_str}{extension}".format(
         course_prefix=course_filename_prefix_generator(course_id),
-        csv_name=csv_name,
-        timestamp_str=start_date.strftime("%Y-%m-%d-%H%M")
+        csv_name='Reporte_Roles',
+        timestamp_str=start_date.strftime("%Y-%m-%d-%H%M"),
+        extension=REPORT_EXTENSIONS[output_format]
     )
-    output_buffer = ContentFile('')
-    if six.PY2:
-        output_buffer.write(codecs.BOM_UTF8)
-    csvwriter = csv.writer(output_buffer)
-    header = ['Username', 'Email','Run', 'Rol']
-    csvwriter.writerow(header)
-    csvwriter.writerows(ReportStore()._get_utf8_encoded_rows(data))
-
-    current_step = {'step': 'CMMAPI Student Role - Uploading CSV'}
-    task_progress.update_task_state(extra_meta=current_step)
 
-    output_buffer.seek(0)
-    report_store.store(course_id, report_name, output_buffer)
+def get_roster_shards(course_key, shard_size=None):
+    """
+        User id ranges [(from, to)) splitting the active enrollments of the course in chunks of shard_size
+    """
+    if shard_size is None:
+        shard_size = getattr(settings, 'CMM_API_ROLE_REPORT_SHARD_SIZE', 20000)
+    user_ids = CourseEnrollment.objects.filter(course_id=course_key, is_active=True).order_by('user_id').values_list('user_id', flat=True)
+    boundaries = [
+        user_id for i, user_id in enumerate(user_ids.iterator(chunk_size=shard_size))
+        if i and i % shard_size == 0
+    ]
+    # first and last shards are open so role holders without enrollment are included
+    return list(zip([None] + boundaries, boundaries + [None]))
+
+def get_shard_filename(entry_id, shard_index):
+    # a sub directory keeps the partial files out of links_for
+    return 'cmmapi-shards/{}/part-{:04d}.csv'.format(entry_id, shard_index)
+
+def save_shard_progress(entry_id, action_name, num_shards, shard_index=None, rows=0):
+    """
+        Save the progress of each shard in the InstructorTask output, the row is locked
+        because shards finish concurrently
+    """
+    with transaction.atomic():
+        entry = InstructorTask.objects.select_for_update().get(pk=entry_id)
+        if entry.task_state == FAILURE:
+            # keep the error written by the shard that failed
+            return
+        try:
+            shards = json.loads(entry.task_output).get('shards', {})
+        except Exception:
+            shards = {}
+        if shard_index is not None:
+            shards[str(shard_index)] = {'state': 'done', 'rows': rows}
+        task_progress = TaskProgress(action_name, num_shards, time())
+        task_progress.attempted = task_progress.succeeded = len(shards)
+        progress = task_progress.update_task_state(extra_meta={
+            'step': 'CMMAPI Student Role - Calculating students data by shards',
+            'shards': shards,
+        })
+        entry.task_output = json.dumps(progress)
+        entry.save_now()
+
+def generate_sharded(entry_id, course_id, shards, action_name, output_format='csv'):
+    """
+        Generate the users role report with one subtask per user id range and a merge step.
+        process_data is ignored so merge_data_shards sets the final state of the InstructorTask.
+    """
+    save_shard_progress(entry_id, action_name, len(shards))
+    header = [
+        process_data_shard.s(entry_id, str(course_id), shard_index, user_from, user_to, len(shards), action_name)
+        for shard_index, (user_from, user_to) in enumerate(shards)
+    ]
+    merge = merge_data_shards.si(entry_id, str(course_id), len(shards), action_name, output_format)
+    # called once every shard returned if one of them failed
+    merge.on_error(cleanup_data_shards.si(entry_id, str(course_id), len(shards)))
+    chord(header)(merge)
+    raise Ignore()
+
+@task(queue='edx.lms.core.low')
+def process_data_shard(entry_id, course_id, shard_index, user_from, user_to, num_shards, action_name):
+    """
+        Write the sorted rows of one user id range to a partial file
+    """
+    course_key = CourseKey.from_string(course_id)
+    if InstructorTask.objects.filter(pk=entry_id, task_state=FAILURE).exists():
+        # another shard failed, the report will not be merged
+        return
+    try:
+        filters = {}
+        if user_from is not None:
+            filters['user_id__gte'] = user_from
+        if user_to is not None:
+            filters['user_id__lt'] = user_to
+        # shards are bounded by CMM_API_ROLE_REPORT_SHARD_SIZE, sort with the same key used to merge them
+        rows = sorted(
+            ([x['username'], x['email'], x['run'], x['rol']] for x in get_roster([course_key], **filters)),
+            key=shard_row_key)
+        with new_report_buffer() as output_buffer:
+            write_report_csv(output_buffer, None, rows)
+            save_report_file(course_key, get_shard_filename(entry_id, shard_index), output_buffer)
+        save_shard_progress(entry_id, action_name, num_shards, shard_index, len(rows))
+    except Exception as exc:
+        # the chord callback does not run if a shard fails
+        InstructorTask.objects.filter(pk=entry_id).update(
+            task_state=FAILURE,
+            task_output=InstructorTask.create_output_for_failure(exc, traceback.format_exc()))
+        notify_task_webhooks(entry_id)
+        # shards still running are removed by cleanup_data_shards
+        delete_shard_files(course_key, entry_id, num_shards)
+        raise
+
+@task(queue='edx.lms.core.low')
+def cleanup_data_shards(entry_id, course_id, num_shards):
+    """
+        Delete the partial files of a sharded report that failed, error callback of the chord
+    """
+    delete_shard_files(CourseKey.from_string(course_id), entry_id, num_shards)
+
+def delete_shard_files(course_key, entry_id, num_shards):
+    report_store = ReportStore.from_config('GRADES_DOWNLOAD')
+    for i in range(num_shards):
+        path = report_store.path_to(course_key, get_shard_filename(entry_id, i))
+        if report_store.storage.exists(path):
+            report_store.storage.delete(path)
+
+def shard_row_key(row):
+    # 'Docente/Equipo' sorts before 'Estudiante', then username ignoring case and accents like the
+    # MySQL collations that order the unsharded report, ties keep the codepoint order
+    return (row[3], unidecode.unidecode(row[0]).lower(), row[0])
+
+@task(base=BaseInstructorTask, queue='edx.lms.core.low')
+def merge_data_shards(entry_id, course_id, num_shards, action_name, output_format='csv'):
+    """
+        Merge the partial files in role and username order and upload one report, the partial files are not compressed.
+        BaseInstructorTask saves the returned progress as the InstructorTask output.
+    """
+    course_key = CourseKey.from_string(course_id)
+    start_date = dt.now(UTC)
+    task_progress = TaskProgress(action_name, num_shards, time())
+    task_progress.attempted = task_progress.succeeded = num_shards
+    task_progress.update_task_state(extra_meta={'step': 'CMMAPI Student Role - Merging shards'})
+    report_store = ReportStore.from_config('GRADES_DOWNLOAD')
+    paths = [report_store.path_to(course_key, get_shard_filename(entry_id, i)) for i in range(num_shards)]
+    shard_files = [report_store.storage.open(path, 'rb') for path in paths]
+    try:
+        readers = [csv.reader(io.TextIOWrapper(x, encoding='utf-8', newline='')) for x in shard_files]
+        report_name = get_roles_report_name(course_key, start_date, output_format)
+        with new_report_buffer() as output_buffer:
+            write_report(output_buffer, ROLES_REPORT_HEADER, heapq.merge(*readers, key=shard_row_key), output_format)
+            task_progress.update_task_state(extra_meta={'step': 'CMMAPI Student Role - Uploading CSV'})
+            store_report_file(course_key, report_name, output_buffer)
+    finally:
+        for x in shard_files:
+            x.close()
+    delete_shard_files(course_key, entry_id, num_shards)
     current_step = {
         'step': 'CMMAPI Student Role - CSV uploaded',
         'report_name': report_name,
     }
     return task_progress.update_task_state(extra_meta=current_step)
 
+def iter_user_info_role_delta(course_key, since, chunk_size=None):
+    """
+        Yield the users added, removed or with a changed role since the date, with the action as last column.
+        Enrollments are compared with the CourseEnrollment history and roles with the CMMRoleChange log,
+        role changes made before the log existed, or in Studio without the app installed, are not detected.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'CMM_API_REPORT_CHUNK_SIZE', 2000)
+    enrollment_changes = CourseEnrollment.history.filter(course_id=course_key, history_date__gte=since)
+    role_changes = CMMRoleChange.objects.filter(course_id=course_key, created__gte=since)
+    user_ids = sorted(
+        set(enrollment_changes.values_list('user_id', flat=True)) |
+        set(role_changes.values_list('user_id', flat=True)))
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[i:i + chunk_size]
+        roster_now = {x['user_id']: x for x in get_roster_queryset([course_key], user_id__in=chunk)}
+        enrolled_before = {}
+        for x in CourseEnrollment.history.filter(course_id=course_key, user_id__in=chunk, history_date__lt=since).order_by('history_date').values('user_id', 'is_active'):
+            enrolled_before[x['user_id']] = x['is_active']
+        roles_before = {}
+        for x in CourseAccessRole.objects.filter(course_id=course_key, user_id__in=chunk).values('user_id', 'role'):
+            roles_before.setdefault(x['user_id'], set()).add(x['role'])
+        # undo the role changes since the date, newest first
+        for x in role_changes.filter(user_id__in=chunk).order_by('-created', '-id').values('user_id', 'role', 'action'):
+            roles = roles_before.setdefault(x['user_id'], set())
+            if x['action'] == CMMRoleChange.ADDED:
+                roles.discard(x['role'])
+            else:
+                roles.add(x['role'])
+        removed_ids = [x for x in chunk if x not in roster_now]
+        removed_users = {
+            x['id']: x for x in User.objects.filter(id__in=removed_ids).annotate(run_value=get_run_expression(user_prefix='')).values('id', 'username', 'email', 'run_value')
+        }
+        for user_id in chunk:
+            if roles_before.get(user_id):
+                rol_before = ROLE_STAFF
+            elif enrolled_before.get(user_id):
+                rol_before = ROLE_STUDENT
+            else:
+                rol_before = None
+            now = roster_now.get(user_id)
+            if now is not None and rol_before is None:
+                yield [now['username'], now['email'], now['run'], now['rol'], 'added']
+            elif now is not None and now['rol'] != rol_before:
+                yield [now['username'], now['email'], now['run'], now['rol'], 'changed']
+            elif now is None and rol_before is not None and user_id in removed_users:
+                user = removed_users[user_id]
+                yield [user['username'], user['email'], user['run_value'], rol_before, 'removed']
+
+def generate_delta(course_id, task_input, action_name):
+    """
+        Generate a CSV file with the users role changes since task_input['since']
+    """
+    start_time = time()
+    start_date = dt.now(UTC)
+    task_progress = TaskProgress(action_name, 1, start_time)
+    current_step = {'step': 'CMMAPI Student Role Delta - Calculating students data'}
+    task_progress.update_task_state(extra_meta=current_step)
+
+    since = parse_datetime(task_input['since'])
+    output_format = task_input.get('output_format', 'csv')
+    report_name = u"{course_prefix}_Reporte_Roles_Cambios_{timestamp_str}{extension}".format(
+        course_prefix=course_filename_prefix_generator(course_id),
+        timestamp_str=start_date.strftime("%Y-%m-%d-%H%M"),
+        extension=REPORT_EXTENSIONS[output_format]
+    )
+    with new_report_buffer() as output_buffer:
+        write_report(output_buffer, ROLES_DELTA_REPORT_HEADER, iter_user_info_role_delta(course_id, since), output_format)
+
+        current_step = {'step': 'CMMAPI Student Role Delta - Uploading CSV'}
+        task_progress.update_task_state(extra_meta=current_step)
+
+        store_report_file(course_id, report_name, output_buffer)
+    current_step = {
+        'step': 'CMMAPI Student Role Delta - CSV uploaded',
+        'report_name': report_name,
+    }
+    return task_progress.update_task_state(extra_meta=current_step)
+
+def get_org_roster_course_key(org):
+    """
+        Course key used to save the org roster task and report, it is not a real course
+    """
+    return CourseLocator(org=org, course='CMM-API', run='ORG-ROSTER')
+
+def get_org_student_data_task_key(org, course_ids, output_format='csv'):
+    courses_hash = hashlib.md5(json.dumps(sorted(course_ids)).encode('utf-8')).hexdigest()
+    task_key = "CMM-API-ORG-STUDENT-DATA-{}-{}".format(org, courses_hash)
+    if output_format != 'csv':
+        task_key = '{}-{}'.format(task_key, output_format)
+    return task_key
+
+def task_process_org_data(request, org, course_ids=None, output_format='csv'):
+    """
+        Submit one roster task for every course of the org, or only for course_ids
+    """
+    task_type = 'cmmapi_org_student_data'
+    task_input = {'org': org, 'course_ids': course_ids or []}
+    if output_format != 'csv':
+        task_input['output_format'] = output_format
+    task_class = route_task(process_org_data, task_type, get_org_roster_course_key(org), task_input)
+    task_key = get_org_student_data_task_key(org, task_input['course_ids'], output_format)
+    check_task_admission(task_type, task_key)
+
+    return submit_task(
+        request,
+        task_type,
+        task_class,
+        get_org_roster_course_key(org),
+        task_input,
+        task_key)
+
+@task(base=BaseInstructorTask, queue='edx.lms.core.low')
+def process_org_data(entry_id, xmodule_instance_args):
+    action_name = ugettext_noop('generated')
+    task_fn = partial(generate_org, xmodule_instance_args)
+
+    return run_main_task(entry_id, task_fn, action_name)
+
+def get_org_course_keys(task_input):
+    from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+    if task_input.get('course_ids'):
+        return [CourseKey.from_string(x) for x in task_input['course_ids']]
+    return list(CourseOverview.objects.filter(org=task_input['org']).values_list('id', flat=True))
+
+def generate_org(_xmodule_instance_args, _entry_id, course_id, task_input, action_name):
+    """
+    Generate one CSV file with the users and role of every course
+    of the org (or the given courses) with a single roster query.
+    """
+    start_time = time()
+    start_date = dt.now(UTC)
+    course_keys = get_org_course_keys(task_input)
+    task_progress = TaskProgress(action_name, len(course_keys), start_time)
+    current_step = {'step': 'CMMAPI Org Student Role - Calculating students data'}
+    task_progress.update_task_state(extra_meta=current_step)
+
+    output_format = task_input.get('output_format', 'csv')
+    report_name = u"{org}_Reporte_Roles_Org_{timestamp_str}{extension}".format(
+        org=task_input['org'],
+        timestamp_str=start_date.strftime("%Y-%m-%d-%H%M"),
+        extension=REPORT_EXTENSIONS[output_format]
+    )
+    header = ['Course ID', 'Username', 'Email', 'Run', 'Rol']
+    chunk_size = getattr(settings, 'CMM_API_REPORT_CHUNK_SIZE', 2000)
+    rows = (
+        [str(x['course_id']), x['username'], x['email'], x['run'], x['rol']]
+        for x in get_roster(course_keys).iterator(chunk_size=chunk_size)
+    ) if course_keys else iter([])
+    with new_report_buffer() as output_buffer:
+        write_report(output_buffer, header, rows, output_format)
+
+        current_step = {'step': 'CMMAPI Org Student Role - Uploading CSV'}
+        task_progress.update_task_state(extra_meta=current_step)
+
+        store_report_file(course_id, report_name, output_buffer)
+    task_progress.attempted = task_progress.succeeded = len(course_keys)
+    current_step = {
+        'step': 'CMMAPI Org Student Role - CSV uploaded',
+        'report_name': report_name,
+    }
+    return task_progress.update_task_state(extra_meta=current_step)
@@ -16,20 +16,56 @@ from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
 from common.djangoapps.student.tests.factories import CourseEnrollmentAllowedFactory, UserFactory, CourseEnrollmentFactory
 from common.djangoapps.student.auth import has_course_author_access
+from common.djangoapps.student.models import CourseEnrollment
+from django.utils import timezone
 from common.djangoapps.student.roles import CourseInstructorRole, CourseStaffRole
 from lms.djangoapps.instructor_task.tasks_helper.enrollments import upload_students_csv
 from lms.djangoapps.instructor_task.models import InstructorTask, ReportStore
+from lms.djangoapps.instructor_task.api_helper import AlreadyRunningError
 from django.test.utils import override_settings
-from cmmapi.serializers import CMMCourseSerializer, CMMProblemSerializer
+from django.core.management import call_command
+from django.db import connection
+from cmmapi.serializers import CMMCourseSerializer, CMMProblemSerializer, CMMReportSerializer, CMMStatusTaskSerializer
 from cmmapi.utils import get_students_features, get_status_tasks, utils_export_ora2_data, get_problem_responses, get_students_roles
-from cmmapi.task import generate
+from cmmapi.task import generate, get_student_data_task_key, get_user_info_role, iter_user_info_role_delta, generate_org, get_org_roster_course_key, get_roster_shards, process_data_shard, merge_data_shards, get_shard_filename, save_shard_progress, shard_row_key
+from cmmapi.utils import get_course_roster, decode_roster_cursor, get_problem_task_key, get_students_query_features, student_features_cache, course_exists_cache, validate_course, decode_task_cursor, wait_task_status, iter_task_status_events, submit_bulk_reports
+from cmmapi.course_signals import invalidate_course_published
+from cmmapi.models import CMMCourseRoster, CMMReport, CMMTaskWebhook
+from cmmapi.routing import estimate_job_size, get_task_route, job_size_cache
+from cmmapi.webhooks import register_task_webhook, notify_task_webhooks, deliver_pending_webhooks, deliver_task_webhooks, schedule_webhook_delivery
+from cmmapi.rest_api import CMMApiStatusTask, CMMApiUsersRole, CMMApiUserCourses, CMMApiStudentRole, CMMApiORA2Report
+from django.core.cache import caches
+from rest_framework.test import APIRequestFactory, force_authenticate
 from unittest.case import SkipTest
 from uuid import uuid4
+from time import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import gzip
+import io
 import re
 import json
 import urllib.parse
 
 
+class WebhookStubHandler(BaseHTTPRequestHandler):
+    """
+        Local http stub that saves the webhook posts
+    """
+    received = []
+    status = 200
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        WebhookStubHandler.received.append(json.loads(self.rfile.read(length).decode('utf-8')))
+        self.send_response(WebhookStubHandler.status)
+        if WebhookStubHandler.status == 307:
+            self.send_header('Location', 'http://169.254.169.254/latest')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
 class TestCMMAPISerializers(ModuleStoreTestCase):
     def setUp(self):
         super(TestCMMAPISerializers, self).setUp()
@@ -58,6 +94,19 @@ class TestCMMAPISerializers(ModuleStoreTestCase):
         }
         serializer = CMMCourseSerializer(data=body)
         self.assertTrue(serializer.is_valid())
+
+    def test_cmm_api_callback_url_serializers(self):
+        """
+            test callback urls are only accepted for the allowed hosts and schemes
+        """
+        body = {"course_id": str(self.course.id), "callback_url": 'https://hooks.example.com/cmm'}
+        self.assertFalse(CMMReportSerializer(data=body).is_valid())
+        with override_settings(CMM_API_WEBHOOK_ALLOWED_HOSTS=['.example.com']):
+            self.assertTrue(CMMReportSerializer(data=body).is_valid())
+            for url in ['http://hooks.example.com/cmm', 'https://169.254.169.254/latest', 'https://example.org/cmm']:
+                serializer = CMMReportSerializer(data=dict(body, callback_url=url))
+                self.assertFalse(serializer.is_valid(), url)
+                self.assertIn('callback_url', serializer.errors)
     
     def test_cmm_api_block_serializers(self):
         """
@@ -69,6 +118,36 @@ class TestCMMAPISerializers(ModuleStoreTestCase):
         serializer = CMMProblemSerializer(data=body)
         self.assertTrue(serializer.is_valid())
 
+    def test_cmm_api_block_list_serializers(self):
+        """
+            test block serializers with a list of blocks of one course
+        """
+        body = {
+            "block_id": 'block-v1:eol+test+2022+type@problem+block@1',
+            "block_ids": [
+                'block-v1:eol+test+2022+type@problem+block@2',
+                'block-v1:eol+test+2022+type@sequential+block@3',
+                'block-v1:eol+test+2022+type@problem+block@2',
+            ]
+        }
+        serializer = CMMProblemSerializer(data=body)
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data['block_ids'], [
+            'block-v1:eol+test+2022+type@problem+block@1',
+            'block-v1:eol+test+2022+type@problem+block@2',
+            'block-v1:eol+test+2022+type@sequential+block@3',
+        ])
+        body = {
+            "block_ids": [
+                'block-v1:eol+test+2022+type@problem+block@2',
+                'block-v1:eol+test+2023+type@problem+block@2',
+            ]
+        }
+        serializer = CMMProblemSerializer(data=body)
+        self.assertFalse(serializer.is_valid())
+        serializer = CMMProblemSerializer(data={})
+        self.assertFalse(serializer.is_valid())
+
     def test_cmm_api_course_serializers_no_exists(self):
         """
             test course serializers when course dont exists
@@ -97,6 +176,31 @@ class TestCMMAPISerializers(ModuleStoreTestCase):
         serializer = CMMProblemSerializer(data=body)
         self.assertFalse(serializer.is_valid())
 
+    def test_cmm_api_validate_course_cached(self):
+        """
+            test course validation is cached until the course is published or the entry expires
+        """
+        course_exists_cache.clear()
+        self.assertTrue(validate_course(str(self.course.id)))
+        with self.assertNumQueries(0):
+            self.assertTrue(validate_course(str(self.course.id)))
+        invalidate_course_published(None, course_key=self.course.id)
+        self.assertIsNone(course_exists_cache.get(str(self.course.id)))
+        self.assertTrue(validate_course(str(self.course.id)))
+        with patch('cmmapi.cache.time', return_value=time() + getattr(settings, 'CMM_API_COURSE_CACHE_TIMEOUT', 300) + 1):
+            self.assertIsNone(course_exists_cache.get(str(self.course.id)))
+
+    def test_cmm_api_status_task_serializers_wrong_cursor(self):
+        """
+            test status task serializers when cursor is wrong
+        """
+        body = {
+            "course_id": str(self.course.id),
+            "cursor": 'asdasdsadsadasdd'
+        }
+        serializer = CMMStatusTaskSerializer(data=body)
+        self.assertFalse(serializer.is_valid())
+
 class TestCMMAPI(ModuleStoreTestCase):
     def setUp(self):
         super(TestCMMAPI, self).setUp()
@@ -128,6 +232,28 @@ class TestCMMAPI(ModuleStoreTestCase):
         expected = {"status": success_status, 'task_id': '123-456-789'}
         self.assertEqual(expected, result)
     
+    def test_cmm_api_student_profile_features_cached(self):
+        """
+            test student profile columns are cached until the course is published, except the cohort column
+        """
+        student_features_cache.clear()
+        features = get_students_query_features(self.course.id)
+        self.assertEqual(features[-2:], ['city', 'country'])
+        with patch('cmmapi.utils.get_course_teams_enabled') as mock_teams, patch('cmmapi.utils.is_course_cohorted') as mock_cohorted:
+            mock_cohorted.return_value = False
+            self.assertEqual(get_students_query_features(self.course.id), features)
+            self.assertFalse(mock_teams.called)
+            # cohorts enabled in the LMS are seen right away
+            mock_cohorted.return_value = True
+            self.assertEqual(get_students_query_features(self.course.id), features[:-2] + ['cohort', 'city', 'country'])
+            self.assertFalse(mock_teams.called)
+            # teams are read again once the course is published
+            mock_cohorted.return_value = False
+            mock_teams.return_value = True
+            invalidate_course_published(None, course_key=self.course.id)
+            self.assertEqual(get_students_query_features(self.course.id), features[:-2] + ['team', 'city', 'country'])
+            self.assertTrue(mock_teams.called)
+
     @patch("cmmapi.utils.submit_task")
     def test_cmm_api_ora2(self, mock_submit):
         """
@@ -150,6 +276,26 @@ class TestCMMAPI(ModuleStoreTestCase):
         expected = {"status": success_status, 'task_id': '123-456-789'}
         self.assertEqual(expected, result)
 
+    @patch("cmmapi.utils.submit_task")
+    def test_cmm_api_problem_many_blocks(self, mock_submit):
+        """
+            test one problem report task is submitted for many blocks
+        """
+        mock_submit.side_effect = [namedtuple("Task",["task_id",])('123-456-789',),]
+        block_ids = [
+            'block-v1:eol+test+2022+type@problem+block@1',
+            'block-v1:eol+test+2022+type@vertical+block@2',
+        ]
+        request = Mock()
+        request.user.pk = self.student.pk
+        result = get_problem_responses(request, block_ids)
+        self.assertEqual(result['task_id'], '123-456-789')
+        _, task_type, _, course_key, task_input, task_key = mock_submit.call_args[0]
+        self.assertEqual(task_input['problem_locations'], ','.join(block_ids))
+        self.assertEqual(str(course_key), 'course-v1:eol+test+2022')
+        self.assertEqual(task_key, get_problem_task_key(course_key, list(reversed(block_ids))))
+        self.assertNotEqual(task_key, get_problem_task_key(course_key, block_ids[:1]))
+
     @patch("cmmapi.task.submit_task")
     def test_cmm_api_user_roles(self, mock_submit):
         """
@@ -161,6 +307,167 @@ class TestCMMAPI(ModuleStoreTestCase):
         expected = {"status": success_status, 'task_id': '123-456-789'}
         self.assertEqual(expected, result)
     
+    @patch("cmmapi.task.submit_task")
+    def test_cmm_api_user_roles_already_running(self, mock_submit):
+        """
+            test users role report returns the running task when it is already running
+        """
+        mock_submit.side_effect = AlreadyRunningError()
+        task = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='PROGRESS',
+                task_output='{"attempted": 1}',
+                requester=self.student,
+            )
+        result = get_students_roles(Mock(), str(self.course.id))
+        expected = {"status": 'Already Running Task', 'task_id': task.task_id, 'task_state': 'PROGRESS', 'task_progress': {'attempted': 1}}
+        self.assertEqual(expected, result)
+
+    def test_cmm_api_user_roles_task_key(self):
+        """
+            test users role reports with other content get their own task key
+        """
+        course_id = str(self.course.id)
+        plain_key = "CMM-API-STUDENT-DATA-{}".format(course_id)
+        self.assertEqual(get_student_data_task_key(self.course.id), plain_key)
+        self.assertEqual(get_student_data_task_key(self.course.id, {'sharded': True}), plain_key)
+        gzip_key = get_student_data_task_key(self.course.id, {'output_format': 'gzip'})
+        since_key = get_student_data_task_key(self.course.id, {'since': '2021-01-01T00:00:00+00:00'})
+        self.assertEqual(len({plain_key, gzip_key, since_key}), 3)
+        self.assertEqual(get_student_data_task_key(self.course.id, {'output_format': 'gzip', 'sharded': True}), gzip_key)
+
+    @patch("cmmapi.task.submit_task")
+    def test_cmm_api_user_roles_recent_report(self, mock_submit):
+        """
+            test users role report reuses a recent report unless force is set
+        """
+        mock_submit.side_effect = [namedtuple("Task",["task_id",])('123-456-789',),]
+        with patch('lms.djangoapps.instructor_task.tasks_helper.runner._get_current_task'):
+            output = generate(None, None, self.course.id, {}, 'CMM-API-STUDENT-DATA')
+        task = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='SUCCESS',
+                task_output=json.dumps(output),
+                requester=self.student,
+            )
+        result = get_students_roles(Mock(), str(self.course.id))
+        self.assertEqual(result['task_id'], task.task_id)
+        self.assertIn('url', result)
+        self.assertFalse(mock_submit.called)
+        result = get_students_roles(Mock(), str(self.course.id), force=True)
+        self.assertEqual(result['task_id'], '123-456-789')
+
+    @patch("cmmapi.task.submit_task")
+    def test_cmm_api_bulk_report(self, mock_submit):
+        """
+            test bulk users role report with valid and invalid courses
+        """
+        mock_submit.side_effect = [namedtuple("Task",["task_id",])('123-456-789',),]
+        course_ids = [str(self.course.id), 'course-v1:eol+Test101+2021', 'asdasd']
+        result = submit_bulk_reports(Mock(), course_ids, 'users-role-report')
+        self.assertEqual(result['results'][str(self.course.id)]['task_id'], '123-456-789')
+        self.assertEqual(result['results']['course-v1:eol+Test101+2021']['status'], 'Invalid Course')
+        self.assertEqual(result['results']['asdasd']['status'], 'Invalid Course')
+        self.assertEqual(mock_submit.call_count, 1)
+
+    @patch("cmmapi.rest_api.get_students_roles")
+    def test_cmm_api_token_bucket_throttle(self, mock_roles):
+        """
+            test report requests are throttled per endpoint with burst and Retry-After
+        """
+        mock_roles.return_value = {'status': 'ok'}
+        caches['default'].clear()
+        job_size_cache.clear()
+        factory = APIRequestFactory()
+        view = CMMApiStudentRole.as_view()
+        rates = {'users-role-report': {'rate': '1/minute', 'burst': 2}}
+        with override_settings(CMM_API_THROTTLE_RATES=rates, CMM_API_THROTTLE_CACHE='default'):
+            status_codes = []
+            for _ in range(3):
+                request = factory.post('/cmm_api/users-role-report/', {'course_id': str(self.course.id)}, format='json')
+                force_authenticate(request, user=self.student)
+                response = view(request)
+                status_codes.append(response.status_code)
+            self.assertEqual(status_codes, [200, 200, 429])
+            self.assertIn('Retry-After', response)
+            self.assertLessEqual(int(response['Retry-After']), 60)
+            # other endpoints have their own bucket
+            with patch("cmmapi.rest_api.utils_export_ora2_data", return_value={'status': 'ok'}):
+                request = factory.post('/cmm_api/ora2-report/', {'course_id': str(self.course.id)}, format='json')
+                force_authenticate(request, user=self.student)
+                response = CMMApiORA2Report.as_view()(request)
+            self.assertEqual(response.status_code, 200)
+
+    @patch("cmmapi.task.submit_task")
+    def test_cmm_api_task_admission(self, mock_submit):
+        """
+            test new reports are rejected with 429 while too many CMM tasks are in progress
+        """
+        mock_submit.side_effect = AlreadyRunningError()
+        course2 = CourseFactory.create(org='mss', course='1000', display_name='2022', emit_signals=True)
+        running = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='PROGRESS',
+                task_output='{}',
+                requester=self.student,
+            )
+        factory = APIRequestFactory()
+        view = CMMApiStudentRole.as_view()
+        with override_settings(CMM_API_MAX_ACTIVE_TASKS=1, CMM_API_THROTTLE_RATES={'default': {'rate': None}}):
+            # the report in progress is returned, not rejected
+            result = get_students_roles(Mock(), str(self.course.id), force=True)
+            self.assertEqual(result['task_id'], running.task_id)
+            request = factory.post('/cmm_api/users-role-report/', {'course_id': str(course2.id), 'force': True}, format='json')
+            force_authenticate(request, user=self.student)
+            response = view(request)
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            self.assertEqual(response.data['estimated_wait'], int(response['Retry-After']))
+            result = submit_bulk_reports(Mock(), [str(course2.id)], 'users-role-report', force=True)
+            self.assertEqual(result['results'][str(course2.id)]['status'], 'Rejected')
+
+    @override_settings(CMM_API_SMALL_JOB_QUEUE='small', CMM_API_BULK_JOB_QUEUE='bulk', CMM_API_JOB_SIZE_THRESHOLDS={'default': 1})
+    def test_cmm_api_task_route(self):
+        """
+            test tasks are routed by the number of active enrollments
+        """
+        job_size_cache.clear()
+        self.assertEqual(get_task_route('cmmapi_student_data', self.course.id), {'queue': 'small'})
+        job_size_cache.clear()
+        CourseEnrollmentFactory(user=self.student, course_id=self.course.id, mode='honor')
+        CourseEnrollmentFactory(user=self.student_2, course_id=self.course.id, mode='honor')
+        self.assertEqual(get_task_route('cmmapi_student_data', self.course.id), {'queue': 'bulk'})
+
+    def test_cmm_api_job_size_containers(self):
+        """
+            test problem reports of container blocks are estimated by the active enrollments
+        """
+        job_size_cache.clear()
+        sequential = 'block-v1:{}+{}+{}+type@sequential+block@1'.format(self.course.id.org, self.course.id.course, self.course.id.run)
+        problem = 'block-v1:{}+{}+{}+type@problem+block@2'.format(self.course.id.org, self.course.id.course, self.course.id.run)
+        enrollments = CourseEnrollment.objects.filter(course_id=self.course.id, is_active=True).count()
+        with self.assertNumQueries(2):
+            size = estimate_job_size('cmmapi_problem_responses_csv', self.course.id, {'problem_locations': ','.join([sequential, problem])})
+        self.assertEqual(size, enrollments)
+
+    def test_cmm_api_task_route_disabled(self):
+        """
+            test tasks keep their default queue when routing is not configured
+        """
+        self.assertEqual(get_task_route('cmmapi_student_data', self.course.id), {})
+
     def test_cmm_api_task_status(self):
         """
             test list task
@@ -192,10 +499,234 @@ class TestCMMAPI(ModuleStoreTestCase):
                 requester=self.student,
             )
         list_task = get_status_tasks(str(self.course.id))
-        expect = [{'task_type': task_1.task_type, 'task_id': task_1.task_id, 'task_state': task_1.task_state, 'task_output': task_1.task_output, 'url': links[0][1]},
+        expect = [{'task_type': task_1.task_type, 'task_id': task_1.task_id, 'task_state': task_1.task_state, 'task_output': task_1.task_output, 'url': links[0][1], 'format': 'csv'},
             {'task_type': task_2.task_type, 'task_id': task_2.task_id, 'task_state': task_2.task_state, 'task_output': task_2.task_output}]
         self.assertEqual(expect, list_task['list_task'])
 
+    def test_cmm_api_task_status_report_index(self):
+        """
+            test reports urls come from the report index without listing the storage
+        """
+        with patch('lms.djangoapps.instructor_task.tasks_helper.runner._get_current_task'):
+            result = generate(None, None, self.course.id, {}, 'CMM-API-STUDENT-DATA')
+        self.assertTrue(CMMReport.objects.filter(course_id=self.course.id, report_name=result['report_name']).exists())
+        task = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='SUCCESS',
+                task_output=json.dumps(result),
+                requester=self.student,
+            )
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        url = report_store.storage.url(report_store.path_to(self.course.id, result['report_name']))
+        with patch('lms.djangoapps.instructor_task.models.DjangoStorageReportStore.links_for') as mock_links:
+            list_task = get_status_tasks(str(self.course.id))
+            mock_links.assert_not_called()
+        self.assertEqual(list_task['list_task'][0]['task_id'], task.task_id)
+        self.assertEqual(list_task['list_task'][0]['url'], url)
+
+    def test_cmm_api_task_status_pagination(self):
+        """
+            test list task pages and filters
+        """
+        tasks = [InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state=state,
+                task_output='{}',
+                requester=self.student,
+            ) for state in ['SUCCESS', 'FAILURE', 'SUCCESS']]
+        page = get_status_tasks(str(self.course.id), page_size=2)
+        self.assertEqual([x['task_id'] for x in page['list_task']], [tasks[0].task_id, tasks[1].task_id])
+        self.assertIsNotNone(page['next_cursor'])
+        page = get_status_tasks(str(self.course.id), after_id=decode_task_cursor(page['next_cursor']), page_size=2)
+        self.assertEqual([x['task_id'] for x in page['list_task']], [tasks[2].task_id])
+        self.assertIsNone(page['next_cursor'])
+        page = get_status_tasks(str(self.course.id), task_state='FAILURE')
+        self.assertEqual([x['task_id'] for x in page['list_task']], [tasks[1].task_id])
+        # clients that do not page get every task
+        with override_settings(CMM_API_STATUS_PAGE_SIZE=1):
+            page = get_status_tasks(str(self.course.id))
+        self.assertEqual([x['task_id'] for x in page['list_task']], [x.task_id for x in tasks])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_cmm_api_task_status_etag(self):
+        """
+            test get-all-task answers 304 when no task changed
+        """
+        factory = APIRequestFactory()
+        view = CMMApiStatusTask.as_view()
+        data = {'course_id': str(self.course.id)}
+        request = factory.get('/cmm_api/get-all-task/', data)
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        request = factory.get('/cmm_api/get-all-task/', data, HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        self.assertEqual(response.status_code, 304)
+        InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='PROGRESS',
+                task_output='{}',
+                requester=self.student,
+            )
+        request = factory.get('/cmm_api/get-all-task/', data, HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cmm_api_wait_task_status(self):
+        """
+            test long-poll and server-sent events of one task
+        """
+        task = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='PROGRESS',
+                task_output='{}',
+                requester=self.student,
+            )
+        result = wait_task_status(task.task_id, last_state='QUEUING', timeout=0)
+        self.assertEqual(result['task_state'], 'PROGRESS')
+        result = wait_task_status(task.task_id, last_state='PROGRESS', timeout=0)
+        self.assertEqual(result['task_state'], 'PROGRESS')
+        task.task_state = 'SUCCESS'
+        task.save()
+        result = wait_task_status(task.task_id, last_state='PROGRESS', timeout=10)
+        self.assertEqual(result['task_state'], 'SUCCESS')
+        events = list(iter_task_status_events(task.task_id, 10))
+        self.assertEqual(len(events), 1)
+        self.assertTrue(events[0].startswith('event: status'))
+        self.assertIsNone(wait_task_status(str(uuid4()), timeout=0))
+
+    @patch("cmmapi.webhooks.deliver_task_webhooks")
+    def test_cmm_api_webhooks(self, mock_deliver):
+        """
+            test finished tasks are posted in one batch to the callback url
+        """
+        server = HTTPServer(('127.0.0.1', 0), WebhookStubHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.shutdown)
+        WebhookStubHandler.received = []
+        WebhookStubHandler.status = 200
+        callback_url = 'http://127.0.0.1:{}/callback'.format(server.server_port)
+        tasks = [InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type=task_type,
+                task_key="CMM-API-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='PROGRESS',
+                task_output='{}',
+                requester=self.student,
+            ) for task_type in ['cmmapi_student_data', 'cmmapi_export_ora2_data']]
+        for task in tasks:
+            register_task_webhook(task.task_id, callback_url)
+        notify_task_webhooks(tasks[0].id)
+        self.assertFalse(mock_deliver.apply_async.called)
+        for task in tasks:
+            task.task_state = 'SUCCESS'
+            task.save()
+            notify_task_webhooks(task.id)
+        self.assertIsNone(deliver_pending_webhooks())
+        self.assertEqual(len(WebhookStubHandler.received), 1)
+        events = WebhookStubHandler.received[0]['events']
+        self.assertEqual(sorted(x['task_id'] for x in events), sorted(x.task_id for x in tasks))
+        self.assertEqual(CMMTaskWebhook.objects.filter(state=CMMTaskWebhook.DELIVERED).count(), 2)
+
+    @patch("cmmapi.webhooks.deliver_task_webhooks")
+    def test_cmm_api_webhooks_retry(self, mock_deliver):
+        """
+            test failed deliveries are retried later
+        """
+        server = HTTPServer(('127.0.0.1', 0), WebhookStubHandler)
+        callback_url = 'http://127.0.0.1:{}/callback'.format(server.server_port)
+        # nothing listens on the port
+        server.server_close()
+        task = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='SUCCESS',
+                task_output='{}',
+                requester=self.student,
+            )
+        register_task_webhook(task.task_id, callback_url)
+        retry_in = deliver_pending_webhooks()
+        self.assertGreater(retry_in, 0)
+        webhook = CMMTaskWebhook.objects.get(task_id=task.task_id)
+        self.assertEqual(webhook.state, CMMTaskWebhook.PENDING)
+        self.assertEqual(webhook.attempts, 1)
+
+    @patch("cmmapi.webhooks.deliver_task_webhooks")
+    def test_cmm_api_webhooks_schedule(self, mock_deliver):
+        """
+            test only one webhook delivery is queued at a time
+        """
+        caches['default'].clear()
+        schedule_webhook_delivery(5)
+        schedule_webhook_delivery(5)
+        schedule_webhook_delivery(300)
+        self.assertEqual(mock_deliver.apply_async.call_count, 1)
+        # an earlier delivery replaces the queued one, which stops when it runs
+        schedule_webhook_delivery(0)
+        self.assertEqual(mock_deliver.apply_async.call_count, 2)
+        first_token = mock_deliver.apply_async.call_args_list[0][1]['args'][0]
+        with patch("cmmapi.webhooks.deliver_pending_webhooks") as mock_pending:
+            # the task object imported by the test, not the patched one
+            deliver_task_webhooks.run(first_token)
+            self.assertFalse(mock_pending.called)
+
+    @patch("cmmapi.webhooks.deliver_task_webhooks")
+    def test_cmm_api_webhooks_redirect(self, mock_deliver):
+        """
+            test redirects of the callback url are not followed and are retried
+        """
+        server = HTTPServer(('127.0.0.1', 0), WebhookStubHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.shutdown)
+        WebhookStubHandler.received = []
+        WebhookStubHandler.status = 307
+        self.addCleanup(setattr, WebhookStubHandler, 'status', 200)
+        task = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{}',
+                task_state='SUCCESS',
+                task_output='{}',
+                requester=self.student,
+            )
+        register_task_webhook(task.task_id, 'http://127.0.0.1:{}/callback'.format(server.server_port))
+        self.assertGreater(deliver_pending_webhooks(), 0)
+        self.assertEqual(len(WebhookStubHandler.received), 1)
+        webhook = CMMTaskWebhook.objects.get(task_id=task.task_id)
+        self.assertEqual(webhook.state, CMMTaskWebhook.PENDING)
+        self.assertEqual(webhook.attempts, 1)
+
 class TestCMMAPI_UserRole(ModuleStoreTestCase):
     def setUp(self):
         super(TestCMMAPI_UserRole, self).setUp()
@@ -296,4 +827,382 @@ class TestCMMAPI_UserRole(ModuleStoreTestCase):
             'Estudiante'
         ])
         expected_data = [header_row, staff_row, student1_row]
-        self._verify_csv_file_report(report_store, expected_data)
\ No newline at end of file
+        self._verify_csv_file_report(report_store, expected_data)
+
+    @override_settings(CMM_API_REPORT_CHUNK_SIZE=1, CMM_API_REPORT_SPOOL_SIZE=1)
+    def test_cmmapi_get_users_role_spooled(self):
+        """
+            test data users role report when rows are read in chunks and the csv is spilled to disk
+        """
+        with patch('common.djangoapps.student.models.cc.User.save'):
+            student_2 = UserFactory(
+                username='student2',
+                password='test',
+                email='student2@edx.org')
+            CourseEnrollmentFactory(
+                user=student_2, course_id=self.course.id, mode='honor')
+        task_input = {}
+        with patch('lms.djangoapps.instructor_task.tasks_helper.runner._get_current_task'):
+            result = generate(
+                None, None, self.course.id,
+                task_input, 'CMM-API-STUDENT-DATA'
+            )
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        header_row = ",".join(['Username', 'Email', 'Run', 'Rol'])
+        student1_row = ",".join([self.student.username, self.student.email, '', 'Estudiante'])
+        student2_row = ",".join([student_2.username, student_2.email, '', 'Estudiante'])
+        expected_data = [header_row, student1_row, student2_row]
+        self._verify_csv_file_report(report_store, expected_data)
+        self.assertEqual(result['report_name'], report_store.links_for(self.course.id)[0][0])
+
+    def test_cmmapi_get_user_info_role_single_row_per_user(self):
+        """
+            test users with many roles or role without enrollment appear once with 'Docente/Equipo'
+        """
+        CourseStaffRole(self.course.id).add_users(self.user_instructor)
+        with patch('common.djangoapps.student.models.cc.User.save'):
+            staff_not_enrolled = UserFactory(
+                username='staffnotenrolled',
+                password='test',
+                email='staffnotenrolled@edx.org')
+        CourseStaffRole(self.course.id).add_users(staff_not_enrolled)
+        data = get_user_info_role(self.course.id)
+        expected = [
+            [self.user_instructor.username, self.user_instructor.email, '', 'Docente/Equipo'],
+            [staff_not_enrolled.username, staff_not_enrolled.email, '', 'Docente/Equipo'],
+            [self.student.username, self.student.email, '', 'Estudiante'],
+        ]
+        self.assertEqual(data, expected)
+
+    @patch('cmmapi.task.EDXLOGIN_ENABLED', False)
+    def test_cmmapi_get_user_info_role_without_edxlogin(self):
+        """
+            test users role report rows when uchileedxlogin relation is not available
+        """
+        from cmmapi.task import get_user_roles_values
+        self.assertEqual(get_user_roles_values(), ('user__username', 'user__email'))
+        data = get_user_info_role(self.course.id)
+        expected = [
+            [self.user_instructor.username, self.user_instructor.email, '', 'Docente/Equipo'],
+            [self.student.username, self.student.email, '', 'Estudiante'],
+        ]
+        self.assertEqual(data, expected)
+
+    def test_cmmapi_get_org_users_role(self):
+        """
+            test org users role report with every course of the org
+        """
+        course_2 = CourseFactory.create(
+            org='mss',
+            course='1000',
+            display_name='2021',
+            emit_signals=True)
+        CourseOverview.get_from_id(course_2.id)
+        CourseEnrollmentFactory(
+            user=self.student, course_id=course_2.id, mode='honor')
+        org_key = get_org_roster_course_key('mss')
+        with patch('lms.djangoapps.instructor_task.tasks_helper.runner._get_current_task'):
+            result = generate_org(
+                None, None, org_key,
+                {'org': 'mss', 'course_ids': []}, 'CMM-API-ORG-STUDENT-DATA'
+            )
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        report_path = report_store.path_to(org_key, result['report_name'])
+        with report_store.storage.open(report_path) as csv_file:
+            csv_file_data = csv_file.read().decode("utf-8-sig")
+        expected_data = [
+            ",".join(['Course ID', 'Username', 'Email', 'Run', 'Rol']),
+            ",".join([str(self.course.id), self.user_instructor.username, self.user_instructor.email, '', 'Docente/Equipo']),
+            ",".join([str(self.course.id), self.student.username, self.student.email, '', 'Estudiante']),
+            ",".join([str(course_2.id), self.student.username, self.student.email, '', 'Estudiante']),
+        ]
+        for data in expected_data:
+            self.assertIn(data, csv_file_data)
+
+    def test_cmmapi_get_users_role_sharded(self):
+        """
+            test users role report generated by shards and merged in one file
+        """
+        entry = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{"sharded": true}',
+                task_state='PROGRESS',
+                task_output='{}',
+                requester=self.student,
+            )
+        shards = get_roster_shards(self.course.id, shard_size=1)
+        self.assertEqual(len(shards), 2)
+        with patch('lms.djangoapps.instructor_task.tasks_helper.runner._get_current_task'):
+            for shard_index, (user_from, user_to) in enumerate(shards):
+                process_data_shard(entry.id, str(self.course.id), shard_index, user_from, user_to, len(shards), 'generated')
+            progress = json.loads(InstructorTask.objects.get(pk=entry.id).task_output)
+            self.assertEqual(progress['succeeded'], 2)
+            self.assertEqual(len(progress['shards']), 2)
+            result = merge_data_shards(entry.id, str(self.course.id), len(shards), 'generated')
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        report_path = report_store.path_to(self.course.id, result['report_name'])
+        with report_store.storage.open(report_path) as csv_file:
+            csv_file_data = csv_file.read().decode("utf-8-sig")
+        expected = "\r\n".join([
+            ",".join(['Username', 'Email', 'Run', 'Rol']),
+            ",".join([self.user_instructor.username, self.user_instructor.email, '', 'Docente/Equipo']),
+            ",".join([self.student.username, self.student.email, '', 'Estudiante']),
+        ]) + "\r\n"
+        self.assertEqual(csv_file_data, expected)
+        self.assertFalse(report_store.storage.exists(report_store.path_to(self.course.id, get_shard_filename(entry.id, 0))))
+
+    def test_cmmapi_shard_row_key(self):
+        """
+            test shard rows are merged by role and username ignoring case and accents
+        """
+        rows = [['Zoe', '', '', 'Estudiante'], ['álvaro', '', '', 'Estudiante'], ['beto', '', '', 'Estudiante'], ['zed', '', '', 'Docente/Equipo']]
+        self.assertEqual([x[0] for x in sorted(rows, key=shard_row_key)], ['zed', 'álvaro', 'beto', 'Zoe'])
+
+    def test_cmmapi_get_users_role_sharded_failure(self):
+        """
+            test the partial files are deleted when a shard fails
+        """
+        entry = InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{"sharded": true}',
+                task_state='PROGRESS',
+                task_output='{}',
+                requester=self.student,
+            )
+        shards = get_roster_shards(self.course.id, shard_size=1)
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        shard_path = report_store.path_to(self.course.id, get_shard_filename(entry.id, 0))
+        with patch('lms.djangoapps.instructor_task.tasks_helper.runner._get_current_task'):
+            process_data_shard(entry.id, str(self.course.id), 0, shards[0][0], shards[0][1], len(shards), 'generated')
+            self.assertTrue(report_store.storage.exists(shard_path))
+            with patch('cmmapi.task.get_roster', side_effect=Exception('shard failed')):
+                with self.assertRaises(Exception):
+                    process_data_shard(entry.id, str(self.course.id), 1, shards[1][0], shards[1][1], len(shards), 'generated')
+        self.assertEqual(InstructorTask.objects.get(pk=entry.id).task_state, 'FAILURE')
+        self.assertFalse(report_store.storage.exists(shard_path))
+        # shards that start after the failure do not write their file
+        process_data_shard(entry.id, str(self.course.id), 0, shards[0][0], shards[0][1], len(shards), 'generated')
+        self.assertFalse(report_store.storage.exists(shard_path))
+        # shards that were running keep the error in the output
+        task_output = InstructorTask.objects.get(pk=entry.id).task_output
+        save_shard_progress(entry.id, 'generated', len(shards), 0, 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.task_state, 'FAILURE')
+        self.assertEqual(entry.task_output, task_output)
+        self.assertIn('shard failed', entry.task_output)
+
+    def test_cmmapi_get_users_role_delta(self):
+        """
+            test users role changes since a date
+        """
+        since = timezone.now()
+        with patch('common.djangoapps.student.models.cc.User.save'):
+            new_student = UserFactory(
+                username='newstudent',
+                password='test',
+                email='newstudent@edx.org')
+            CourseEnrollmentFactory(
+                user=new_student, course_id=self.course.id, mode='honor')
+        CourseEnrollment.unenroll(self.student, self.course.id)
+        CourseInstructorRole(self.course.id).remove_users(self.user_instructor)
+        data = list(iter_user_info_role_delta(self.course.id, since))
+        expected = [
+            [self.user_instructor.username, self.user_instructor.email, '', 'Estudiante', 'changed'],
+            [self.student.username, self.student.email, '', 'Estudiante', 'removed'],
+            [new_student.username, new_student.email, '', 'Estudiante', 'added'],
+        ]
+        self.assertEqual(data, expected)
+
+    def test_cmmapi_roster_table(self):
+        """
+            test the roster table is kept current by the signals and read by the roles report
+        """
+        expected = [
+            [self.user_instructor.username, self.user_instructor.email, '', 'Docente/Equipo'],
+            [self.student.username, self.student.email, '', 'Estudiante'],
+        ]
+        # disabled table, the signals do not write it
+        CourseStaffRole(self.course.id).add_users(self.student)
+        self.assertFalse(CMMCourseRoster.objects.exists())
+        CourseStaffRole(self.course.id).remove_users(self.student)
+        # TestCase never commits, run the on_commit callbacks right away
+        with override_settings(CMM_API_USE_ROSTER_TABLE=True), patch('cmmapi.role_signals.transaction.on_commit', side_effect=lambda func: func()):
+            call_command('backfill_cmm_roster', str(self.course.id), stdout=io.StringIO())
+            self.assertEqual(get_user_info_role(self.course.id), expected)
+            CourseInstructorRole(self.course.id).remove_users(self.user_instructor)
+            CourseEnrollment.unenroll(self.student, self.course.id)
+            self.student.email = 'student2@edx.org'
+            self.student.save()
+            self.assertEqual(get_user_info_role(self.course.id), [
+                [self.user_instructor.username, self.user_instructor.email, '', 'Estudiante'],
+            ])
+            self.user_instructor.profile.name = 'Ñandú'
+            self.user_instructor.profile.save()
+            self.assertEqual(CMMCourseRoster.objects.get(user=self.user_instructor).name_search, 'nandu')
+            CMMCourseRoster.objects.all().delete()
+            call_command('backfill_cmm_roster', str(self.course.id), stdout=io.StringIO())
+            self.assertEqual(get_user_info_role(self.course.id), [
+                [self.user_instructor.username, self.user_instructor.email, '', 'Estudiante'],
+            ])
+
+    def test_cmmapi_users_role_sync(self):
+        """
+            test users-role serves the roster in pages, as ndjson and rejects large courses
+        """
+        caches['default'].clear()
+        job_size_cache.clear()
+        factory = APIRequestFactory()
+        view = CMMApiUsersRole.as_view()
+        request = factory.get('/cmm_api/users-role/', {'course_id': str(self.course.id), 'page_size': 1})
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['users'], [{'username': 'instructor', 'email': 'instructor@edx.org', 'run': '', 'rol': 'Docente/Equipo'}])
+        request = factory.get('/cmm_api/users-role/', {'course_id': str(self.course.id), 'page_size': 1, 'cursor': response.data['next_cursor']})
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        self.assertEqual(response.data['users'], [{'username': 'student', 'email': 'student@edx.org', 'run': '', 'rol': 'Estudiante'}])
+        self.assertIsNone(response.data['next_cursor'])
+        call_command('backfill_cmm_roster', str(self.course.id), stdout=io.StringIO())
+        with override_settings(CMM_API_USE_ROSTER_TABLE=True):
+            page = get_course_roster(str(self.course.id), page_size=1)
+            self.assertEqual([x['username'] for x in page['users']], ['instructor'])
+            page = get_course_roster(str(self.course.id), after_username=decode_roster_cursor(page['next_cursor']), page_size=1)
+            self.assertEqual([x['username'] for x in page['users']], ['student'])
+            self.assertIsNone(page['next_cursor'])
+        request = factory.get('/cmm_api/users-role/', {'course_id': str(self.course.id), 'format': 'ndjson'})
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(x)['username'] for x in lines], ['instructor', 'student'])
+        job_size_cache.clear()
+        with override_settings(CMM_API_SYNC_ROSTER_MAX_USERS=1):
+            request = factory.get('/cmm_api/users-role/', {'course_id': str(self.course.id)})
+            force_authenticate(request, user=self.student)
+            response = view(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('report_url', response.data)
+
+    def test_cmmapi_users_role_search(self):
+        """
+            test users-role filters by role, enrollment, prefixes and name
+        """
+        caches['default'].clear()
+        self.student.profile.name = 'José Pérez'
+        self.student.profile.save()
+        CourseEnrollment.unenroll(self.user_instructor, self.course.id)
+        factory = APIRequestFactory()
+        view = CMMApiUsersRole.as_view()
+        cases = [
+            ({'role': 'Docente/Equipo'}, ['instructor']),
+            ({'role': 'Estudiante'}, ['student']),
+            ({'is_enrolled': 'false'}, ['instructor']),
+            ({'is_enrolled': 'true', 'role': 'Docente/Equipo'}, []),
+            ({'username': 'stu'}, ['student']),
+            ({'email': 'instructor@'}, ['instructor']),
+            ({'run': '0000'}, []),
+            ({'name': 'jose'}, ['student']),
+            ({'name': 'PÉREZ'}, ['student']),
+        ]
+        call_command('backfill_cmm_roster', str(self.course.id), stdout=io.StringIO())
+        for use_table in [False, True]:
+            with override_settings(CMM_API_USE_ROSTER_TABLE=use_table):
+                for params, expected in cases:
+                    if 'name' in params and not use_table and connection.vendor != 'mysql':
+                        # without the table accents are ignored by the MySQL collation
+                        continue
+                    data = dict(params, course_id=str(self.course.id))
+                    request = factory.get('/cmm_api/users-role/', data)
+                    force_authenticate(request, user=self.student)
+                    response = view(request)
+                    self.assertEqual(response.status_code, 200, params)
+                    self.assertEqual([x['username'] for x in response.data['users']], expected, params)
+        # lookups by user skip the course size limit, role and is_enrolled do not
+        job_size_cache.clear()
+        with override_settings(CMM_API_SYNC_ROSTER_MAX_USERS=0):
+            for params, status_code in [({'username': 'stu'}, 200), ({'name': 'j'}, 400), ({'is_enrolled': 'false'}, 400), ({'role': 'Estudiante'}, 400)]:
+                request = factory.get('/cmm_api/users-role/', dict(params, course_id=str(self.course.id)))
+                force_authenticate(request, user=self.student)
+                response = view(request)
+                self.assertEqual(response.status_code, status_code, params)
+
+    def test_cmmapi_users_role_throttle(self):
+        """
+            test users-role and user-courses have their own token bucket
+        """
+        caches['default'].clear()
+        factory = APIRequestFactory()
+        rates = {'users-role': {'rate': '1/minute', 'burst': 1}, 'user-courses': {'rate': '1/minute', 'burst': 1}}
+        with override_settings(CMM_API_THROTTLE_RATES=rates, CMM_API_THROTTLE_CACHE='default'):
+            for view, url, params in [
+                    (CMMApiUsersRole.as_view(), '/cmm_api/users-role/', {'course_id': str(self.course.id)}),
+                    (CMMApiUserCourses.as_view(), '/cmm_api/user-courses/', {'username': 'student'})]:
+                status_codes = []
+                for _ in range(2):
+                    request = factory.get(url, params)
+                    force_authenticate(request, user=self.student)
+                    status_codes.append(view(request).status_code)
+                self.assertEqual(status_codes, [200, 429], url)
+
+    def test_cmmapi_user_courses(self):
+        """
+            test user-courses returns every course of the user by username or email
+        """
+        caches['default'].clear()
+        course2 = CourseFactory.create(org='mss', course='1000', display_name='2022', emit_signals=True)
+        with patch('common.djangoapps.student.models.cc.User.save'):
+            CourseEnrollmentFactory(user=self.student, course_id=course2.id, mode='honor')
+        CourseStaffRole(course2.id).add_users(self.student)
+        factory = APIRequestFactory()
+        view = CMMApiUserCourses.as_view()
+        request = factory.get('/cmm_api/user-courses/', {'username': 'student', 'page_size': 1})
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        courses = response.data['courses']
+        request = factory.get('/cmm_api/user-courses/', {'email': 'student@edx.org', 'cursor': response.data['next_cursor']})
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        self.assertIsNone(response.data['next_cursor'])
+        courses += response.data['courses']
+        self.assertEqual(
+            sorted((x['course_id'], x['rol'], x['is_enrolled']) for x in courses),
+            sorted([(str(self.course.id), 'Estudiante', True), (str(course2.id), 'Docente/Equipo', True)]))
+        request = factory.get('/cmm_api/user-courses/', {'username': 'student', 'email': 'student@edx.org'})
+        force_authenticate(request, user=self.student)
+        response = view(request)
+        self.assertEqual(response.status_code, 400)
+
+    def test_cmmapi_get_users_role_gzip(self):
+        """
+            test users role report compressed with gzip
+        """
+        with patch('lms.djangoapps.instructor_task.tasks_helper.runner._get_current_task'):
+            result = generate(None, None, self.course.id, {'output_format': 'gzip'}, 'CMM-API-STUDENT-DATA')
+        self.assertTrue(result['report_name'].endswith('.csv.gz'))
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        with report_store.storage.open(report_store.path_to(self.course.id, result['report_name'])) as report_file:
+            csv_file_data = gzip.decompress(report_file.read()).decode('utf-8')
+        self.assertEqual(csv_file_data.splitlines(), [
+            'Username,Email,Run,Rol',
+            'instructor,instructor@edx.org,,Docente/Equipo',
+            'student,student@edx.org,,Estudiante',
+        ])
+        InstructorTask.objects.create(
+                course_id=self.course.id,
+                task_id=str(uuid4()),
+                task_type='cmmapi_student_data',
+                task_key="CMM-API-STUDENT-DATA-{}".format(str(self.course.id)),
+                task_input='{"output_format": "gzip"}',
+                task_state='SUCCESS',
+                task_output=json.dumps(result),
+                requester=self.student,
+            )
+        list_task = get_status_tasks(str(self.course.id))
+        self.assertEqual(list_task['list_task'][0]['format'], 'gzip')
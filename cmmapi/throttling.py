@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from django.conf import settings
+from django.core.cache import caches
+from opaque_keys.edx.keys import CourseKey, UsageKey
+from rest_framework.throttling import BaseThrottle
+from .routing import estimate_job_size
+from .utils import validate_course
+from time import time, sleep
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+RATE_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_rate(rate):
+    """
+        Tokens per second of a '<tokens>/<period>' rate (e.g. '10/hour'), None disables the throttle
+    """
+    if rate is None:
+        return None
+    num, period = rate.split('/')
+    return int(num) / RATE_PERIODS[period[0]]
+
+def get_throttle_rate(scope, view_default=None):
+    """
+        Refill rate (tokens per second) and burst of the scope. Scopes not configured use the default of the view
+        (paged endpoints are called many times in a row), then the 'default' scope, which falls back to CMM_API_RATE
+    """
+    rates = getattr(settings, 'CMM_API_THROTTLE_RATES', {})
+    conf = rates.get(scope) or view_default or rates.get('default') or {'rate': getattr(settings, 'CMM_API_RATE', '1/minute'), 'burst': 1}
+    return parse_rate(conf.get('rate')), max(int(conf.get('burst', 1)), 1)
+
+def take_tokens(key, rate, burst, cost):
+    """
+        Take cost tokens of the bucket, returns 0 if they were taken or the seconds until there are enough tokens.
+        The bucket is locked with cache.add so concurrent requests of all workers see the same tokens,
+        a full bucket is not stored.
+    """
+    cache = caches[getattr(settings, 'CMM_API_THROTTLE_CACHE', 'default')]
+    lock_key = '{}.lock'.format(key)
+    locked = False
+    for _ in range(getattr(settings, 'CMM_API_THROTTLE_LOCK_RETRIES', 5)):
+        if cache.add(lock_key, 1, timeout=1):
+            locked = True
+            break
+        sleep(0.01)
+    try:
+        now = time()
+        tokens, updated = cache.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < cost:
+            return (cost - tokens) / rate
+        cache.set(key, (tokens - cost, now), timeout=math.ceil((burst - tokens + cost) / rate))
+        return 0
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+def get_request_block_ids(request):
+    block_ids = request.data.get('block_ids') or []
+    block_ids = [block_ids] if isinstance(block_ids, str) else list(block_ids)
+    if request.data.get('block_id'):
+        block_ids.append(request.data['block_id'])
+    return block_ids
+
+def get_request_course_key(request):
+    """
+        Course of the report request from its course_id or block ids, None if it is not valid
+    """
+    try:
+        if request.data.get('course_id'):
+            course_key = CourseKey.from_string(request.data['course_id'])
+        elif get_request_block_ids(request):
+            course_key = UsageKey.from_string(get_request_block_ids(request)[0]).course_key
+        else:
+            return None
+    except Exception:
+        return None
+    if not validate_course(str(course_key)):
+        return None
+    return course_key
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+        Token bucket per user and view throttle_scope, with the rate and burst of CMM_API_THROTTLE_RATES.
+        Views with throttle_task_type take one token plus one for every CMM_API_THROTTLE_COST_UNIT
+        of estimated job size, so large reports use more of the bucket.
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_cost(self, request, view, burst):
+        task_type = getattr(view, 'throttle_task_type', None)
+        if task_type is None:
+            return 1
+        course_key = get_request_course_key(request)
+        if course_key is None:
+            return 1
+        task_input = {'problem_locations': ','.join(get_request_block_ids(request))}
+        size = estimate_job_size(task_type, course_key, task_input)
+        cost = 1 + size // getattr(settings, 'CMM_API_THROTTLE_COST_UNIT', 5000)
+        # a request bigger than the bucket would never be allowed
+        return min(cost, burst)
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None or request.user.is_anonymous:
+            return True
+        rate, burst = get_throttle_rate(scope, getattr(view, 'throttle_default_rate', None))
+        if not rate:
+            return True
+        cost = self.get_cost(request, view, burst)
+        key = 'cmmapi.throttle.{}.{}'.format(scope, request.user.pk)
+        self.wait_seconds = take_tokens(key, rate, burst, cost)
+        if self.wait_seconds:
+            logger.info("CMMApi - Throttled {}, user: {}, cost: {}, wait: {}".format(scope, request.user.pk, cost, self.wait_seconds))
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
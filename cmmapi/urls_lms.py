@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.conf.urls import url
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from .rest_api import CMMApiStudentProfile, CMMApiStatusTask, CMMApiORA2Report, CMMApiProblemReport, CMMApiStudentRole
+from .rest_api import CMMApiStudentProfile, CMMApiStatusTask, CMMApiORA2Report, CMMApiProblemReport, CMMApiStudentRole, CMMApiTaskStatus, CMMApiBulkReport, CMMApiOrgRosterReport, CMMApiUsersRole, CMMApiUserCourses
 
 
 urlpatterns = [
@@ -11,4 +11,9 @@ urlpatterns = [
     url(r'^ora2-report/$', CMMApiORA2Report.as_view(), name='ora2-report'),
     url(r'^problem-report/$', CMMApiProblemReport.as_view(), name='problem-report'),
     url(r'^users-role-report/$', CMMApiStudentRole.as_view(), name='users-role-report'),
+    url(r'^task-status/$', CMMApiTaskStatus.as_view(), name='task-status'),
+    url(r'^bulk-report/$', CMMApiBulkReport.as_view(), name='bulk-report'),
+    url(r'^org-roster-report/$', CMMApiOrgRosterReport.as_view(), name='org-roster-report'),
+    url(r'^users-role/$', CMMApiUsersRole.as_view(), name='users-role'),
+    url(r'^user-courses/$', CMMApiUserCourses.as_view(), name='user-courses'),
 ]
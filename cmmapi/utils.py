@@ -4,11 +4,11 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
-from django.utils.translation import ugettext as _
 from django.db import transaction
 from django.urls import reverse
 from urllib.parse import urlencode
 from itertools import cycle
+from functools import lru_cache
 from opaque_keys.edx.keys import CourseKey, UsageKey
 from opaque_keys import InvalidKeyError
 from lms.djangoapps.instructor_analytics import basic as instructor_analytics_basic
@@ -29,9 +29,18 @@ from xmodule.course_module import DEFAULT_START_DATE, CourseFields
 from openedx.core.djangoapps.models.course_details import CourseDetails
 from openedx.core.djangoapps.course_groups.cohorts import is_course_cohorted
 from openedx.core.djangoapps.site_configuration import helpers as configuration_helpers
-from .task import task_process_data
+from .task import task_process_data, get_student_data_task_key, task_process_org_data, get_org_student_data_task_key, get_roster, get_roster_search_filters, get_user_lookup_filter, get_report_format, hash_task_input
+from .cache import course_exists_cache, student_features_cache
+from .models import CMMReport
+from .routing import route_task, estimate_job_size
+from .admission import check_task_admission, TaskAdmissionError
 from lms.djangoapps.courseware.access import has_access
 from datetime import datetime as dt
+from time import time, sleep
+from celery.states import READY_STATES, SUCCESS
+from django.utils import timezone
+from datetime import timedelta
+from django.db.models import Count, Max, Q
 import unidecode
 import logging
 import json
@@ -39,22 +48,32 @@ import six
 import csv
 import re
 import io
+import base64
+import hashlib
 
 logger = logging.getLogger(__name__)
-TASK_TYPES = ['cmmapi_profile_info_csv', 'cmmapi_problem_responses_csv', 'cmmapi_export_ora2_data', 'cmmapi_student_data']
+TASK_TYPES = ['cmmapi_profile_info_csv', 'cmmapi_problem_responses_csv', 'cmmapi_export_ora2_data', 'cmmapi_student_data', 'cmmapi_org_student_data']
 
 def validate_course(id_curso):
     """
         Verify if course.id exists
     """
     from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+    exists = course_exists_cache.get(id_curso)
+    if exists is not None:
+        return exists
     try:
         aux = CourseKey.from_string(id_curso)
-        return CourseOverview.objects.filter(id=aux).exists()
+        exists = CourseOverview.objects.filter(id=aux).exists()
     except InvalidKeyError:
         logger.error("CMM-Api error validate course, invalid format: {}".format(id_curso))
-        return False
+        exists = False
+    # missing courses are cached for less time, they could be created soon
+    timeout = None if exists else getattr(settings, 'CMM_API_COURSE_CACHE_NEGATIVE_TIMEOUT', 30)
+    course_exists_cache.set(id_curso, exists, timeout=timeout)
+    return exists
 
+@lru_cache(maxsize=1024)
 def validate_block(block_id):
     """
         Verify if block id is valid id
@@ -66,99 +85,415 @@ def validate_block(block_id):
         logger.error("CMM-Api error validate block id, invalid format: {}".format(block_id))
         return False
 
-def get_students_features(request, course_id):
+def get_student_profile_task_key(course_key):
+    return "CMM-API-STUDENT-PROFILE-{}".format(str(course_key))
+
+def get_ora2_task_key(course_key):
+    return "CMM-API-ORA2-REPORT-{}".format(str(course_key))
+
+def get_problem_task_key(course_key, problem_locations):
+    # reports of different blocks of the course can run at the same time
+    blocks_hash = hashlib.md5(','.join(sorted(problem_locations)).encode('utf-8')).hexdigest()
+    return "CMM-API-PROBLEM-REPORT-{}-{}".format(str(course_key), blocks_hash)
+
+def get_running_task_response(task_type, task_key):
     """
-    Respond a summary of all enrolled students profile information.
+        Response for an already running task, with the id and progress of the in-flight task so the client can wait on it
     """
-    course_key = CourseKey.from_string(course_id)
-    course = get_course_by_id(course_key)
-    query_features = list(configuration_helpers.get_value('student_profile_download_fields', []))
-
-    if not query_features:
-        query_features = [
-            'id', 'username', 'name', 'email', 'language', 'location',
-            'year_of_birth', 'gender', 'level_of_education', 'mailing_address',
-            'goals', 'enrollment_mode', 'verification_status',
-            'last_login', 'date_joined',
-        ]
-
-    query_features_names = {
-        'id': _('User ID'),
-        'username': _('Username'),
-        'name': _('Name'),
-        'email': _('Email'),
-        'language': _('Language'),
-        'location': _('Location'),
-        'year_of_birth': _('Birth Year'),
-        'gender': _('Gender'),
-        'level_of_education': _('Level of Education'),
-        'mailing_address': _('Mailing Address'),
-        'goals': _('Goals'),
-        'enrollment_mode': _('Enrollment Mode'),
-        'verification_status': _('Verification Status'),
-        'last_login': _('Last Login'),
-        'date_joined': _('Date Joined'),
-    }
+    response = {"status": 'Already Running Task'}
+    task = InstructorTask.objects.filter(task_type=task_type, task_key=task_key).exclude(task_state__in=READY_STATES).order_by('-id').values('task_id', 'task_state', 'task_output').first()
+    if task is None:
+        return response
+    response['task_id'] = task['task_id']
+    response['task_state'] = task['task_state']
+    try:
+        response['task_progress'] = json.loads(task['task_output'])
+    except Exception:
+        response['task_progress'] = None
+    return response
+
+def get_recent_report_response(task_type, course_key, task_input):
+    """
+        Response with the report of a successful task of the same type and input
+        created in the last CMM_API_REPORT_CACHE_MAX_AGE seconds, None if there is not one.
+    """
+    max_age = getattr(settings, 'CMM_API_REPORT_CACHE_MAX_AGE', 600)
+    if not max_age:
+        return None
+    input_hash = hash_task_input(task_input)
+    recent_tasks = InstructorTask.objects.filter(
+        course_id=course_key,
+        task_type=task_type,
+        task_state=SUCCESS,
+        created__gte=timezone.now() - timedelta(seconds=max_age)
+    ).order_by('-id').values('task_id', 'task_input', 'task_output')[:10]
+    for task in recent_tasks:
+        try:
+            if hash_task_input(json.loads(task['task_input'])) != input_hash:
+                continue
+            report_name = json.loads(task['task_output'])['report_name']
+        except Exception:
+            continue
+        urls = get_report_urls(course_key, [report_name])
+        if report_name in urls:
+            return {"status": 'El reporte fue generado recientemente.', 'task_id': task['task_id'], 'url': urls[report_name]}
+    return None
 
-    if is_course_cohorted(course.id):
-        # Translators: 'Cohort' refers to a group of students within a course.
+def get_course_teams_enabled(course_key):
+    """
+        teams_enabled of the course from its CourseOverview, the course is loaded from the modulestore
+        only if the overview does not have it
+    """
+    from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+    try:
+        teams_enabled = getattr(CourseOverview.get_from_id(course_key), 'teams_enabled', None)
+    except CourseOverview.DoesNotExist:
+        teams_enabled = None
+    if teams_enabled is None:
+        teams_enabled = get_course_by_id(course_key).teams_enabled
+    return bool(teams_enabled)
+
+def get_students_query_features(course_key):
+    """
+        Profile report columns of the course for the current site. The site columns and the teams flag are
+        cached by site until the course is published, cohorts are enabled in the LMS and read every time.
+    """
+    site_configuration = configuration_helpers.get_current_site_configuration()
+    site_key = site_configuration.site_id if site_configuration else None
+    site_features = student_features_cache.get(str(course_key)) or {}
+    if site_key not in site_features:
+        query_features = list(configuration_helpers.get_value('student_profile_download_fields', []))
+
+        if not query_features:
+            query_features = [
+                'id', 'username', 'name', 'email', 'language', 'location',
+                'year_of_birth', 'gender', 'level_of_education', 'mailing_address',
+                'goals', 'enrollment_mode', 'verification_status',
+                'last_login', 'date_joined',
+            ]
+
+        site_features[site_key] = (query_features, get_course_teams_enabled(course_key))
+        student_features_cache.set(str(course_key), site_features)
+    base_features, teams_enabled = site_features[site_key]
+    query_features = list(base_features)
+
+    if is_course_cohorted(course_key):
         query_features.append('cohort')
-        query_features_names['cohort'] = _('Cohort')
 
-    if course.teams_enabled:
+    if teams_enabled:
         query_features.append('team')
-        query_features_names['team'] = _('Team')
 
     # For compatibility reasons, city and country should always appear last.
     query_features.append('city')
-    query_features_names['city'] = _('City')
     query_features.append('country')
-    query_features_names['country'] = _('Country')
 
+    return query_features
+
+def get_students_features(request, course_id, force=False):
+    """
+    Respond a summary of all enrolled students profile information.
+    """
+    course_key = CourseKey.from_string(course_id)
+    query_features = get_students_query_features(course_key)
+
+    if not force:
+        recent_report = get_recent_report_response('cmmapi_profile_info_csv', course_key, query_features)
+        if recent_report is not None:
+            return recent_report
     try:
         task = submit_calculate_students_features_csv(request, course_key, query_features)
         success_status = 'El reporte Perfil de estudiantes está siendo creado.'
         return {"status": success_status, 'task_id': task.task_id}
     except AlreadyRunningError:
-        return {"status": 'Already Running Task'}
+        return get_running_task_response('cmmapi_profile_info_csv', get_student_profile_task_key(course_key))
 
 def submit_calculate_students_features_csv(request, course_key, features):
     """
     Submits a task to generate a CSV containing student profile info.
 
-    Raises AlreadyRunningError if said CSV is already being updated.
+    Raises AlreadyRunningError if said CSV is already being updated
+    and TaskAdmissionError if there are too many reports in progress.
     """
     task_type = 'cmmapi_profile_info_csv'
-    task_class = calculate_students_features_csv
     task_input = features
-    task_key = "CMM-API-STUDENT-PROFILE-{}".format(str(course_key))
+    task_class = route_task(calculate_students_features_csv, task_type, course_key, task_input)
+    task_key = get_student_profile_task_key(course_key)
+    check_task_admission(task_type, task_key)
 
     return submit_task(request, task_type, task_class, course_key, task_input, task_key)
 
-def get_status_tasks(course_id):
+def get_report_urls(course_key, report_names):
     """
-        Get list of all task in the course with url to download it
+        Get download url of the indexed reports, only signing the requested names.
+        Reports stored before the index existed are checked in the storage and indexed.
     """
-    course_key = CourseKey.from_string(course_id)
-    list_task_aux = list(InstructorTask.objects.filter(task_type__in=TASK_TYPES, course_id=course_key).values('task_type', 'task_id', 'task_state', 'task_output'))
-    list_task_download = {}
-    list_task = []
+    report_names = set(report_names)
+    if not report_names:
+        return {}
     report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
-    for name, url in report_store.links_for(course_key):
-        list_task_download[name] = url
-    for x in list_task_aux:
+    indexed = set(CMMReport.objects.filter(course_id=course_key, report_name__in=report_names).values_list('report_name', flat=True))
+    urls = {}
+    for name in report_names:
+        path = report_store.path_to(course_key, name)
+        if name not in indexed:
+            if not report_store.storage.exists(path):
+                continue
+            CMMReport.index(course_key, name)
+        urls[name] = report_store.storage.url(path)
+    return urls
+
+def encode_task_cursor(last_id):
+    return base64.urlsafe_b64encode('id:{}'.format(last_id).encode('utf-8')).decode('utf-8')
+
+def decode_task_cursor(cursor):
+    """
+        Get the last InstructorTask id of an opaque cursor, raises ValueError if it is not valid
+    """
+    try:
+        prefix, last_id = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8').split(':')
+    except Exception:
+        raise ValueError("Invalid cursor: {}".format(cursor))
+    if prefix != 'id' or not last_id.isdigit():
+        raise ValueError("Invalid cursor: {}".format(cursor))
+    return int(last_id)
+
+def encode_cursor(prefix, value):
+    return base64.urlsafe_b64encode('{}:{}'.format(prefix, value).encode('utf-8')).decode('utf-8')
+
+def decode_cursor(prefix, cursor):
+    """
+        Get the value of an opaque 'prefix:value' cursor, raises ValueError if it is not valid
+    """
+    try:
+        cursor_prefix, value = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8').split(':', 1)
+    except Exception:
+        raise ValueError("Invalid cursor: {}".format(cursor))
+    if cursor_prefix != prefix or not value:
+        raise ValueError("Invalid cursor: {}".format(cursor))
+    return value
+
+def encode_roster_cursor(last_username):
+    return encode_cursor('username', last_username)
+
+def decode_roster_cursor(cursor):
+    return decode_cursor('username', cursor)
+
+def decode_course_cursor(cursor):
+    """
+        Get the last course key of an opaque user courses cursor, raises ValueError if it is not valid
+    """
+    try:
+        return CourseKey.from_string(decode_cursor('course', cursor))
+    except InvalidKeyError:
+        raise ValueError("Invalid cursor: {}".format(cursor))
+
+def is_sync_roster_allowed(course_id):
+    """
+        Check if the course is small enough (active enrollments) to serve its roster in the request
+    """
+    course_key = CourseKey.from_string(course_id)
+    return estimate_job_size('cmmapi_student_data', course_key) <= getattr(settings, 'CMM_API_SYNC_ROSTER_MAX_USERS', 2000)
+
+def get_roster_row(row):
+    return {'username': row['username'], 'email': row['email'], 'run': row['run'], 'rol': row['rol']}
+
+ROSTER_SEARCH_FILTERS = ['role', 'is_enrolled', 'username', 'email', 'run', 'name']
+# filters that select a few users, role and is_enrolled can still match the whole course
+SELECTIVE_ROSTER_FILTERS = ['username', 'email', 'run', 'name']
+
+def is_selective_roster_search(search):
+    """
+        True if the search selects a few users: a username, email, run or name of at least
+        CMM_API_ROSTER_MIN_SEARCH_LENGTH characters, shorter values can match most of the course
+    """
+    min_length = getattr(settings, 'CMM_API_ROSTER_MIN_SEARCH_LENGTH', 3)
+    return any(len(search.get(k) or '') >= min_length for k in SELECTIVE_ROSTER_FILTERS)
+
+def get_course_roster(course_id, after_username=None, page_size=None, role=None, is_enrolled=None, **search):
+    """
+        Get a page of the users role rows of the course ordered by username, next_cursor points to the following page.
+        search accepts the username, email and run prefixes and the name of get_roster_search_filters.
+    """
+    course_key = CourseKey.from_string(course_id)
+    if page_size is None:
+        page_size = getattr(settings, 'CMM_API_ROSTER_PAGE_SIZE', 500)
+    filters = get_roster_search_filters(**search)
+    if after_username is not None:
+        # the roster table has its own username column and (course_id, username) index
+        username_field = 'username' if getattr(settings, 'CMM_API_USE_ROSTER_TABLE', False) else 'user__username'
+        filters.append(Q(**{'{}__gt'.format(username_field): after_username}))
+    roster = get_roster([course_key], *filters, role=role, is_enrolled=is_enrolled)
+    users = [get_roster_row(x) for x in roster.order_by('username')[:page_size + 1]]
+    next_cursor = None
+    if len(users) > page_size:
+        users = users[:page_size]
+        next_cursor = encode_roster_cursor(users[-1]['username'])
+    return {
+        'users': users,
+        'next_cursor': next_cursor,
+    }
+
+def iter_course_roster_ndjson(course_id, role=None, is_enrolled=None, **search):
+    """
+        Yield every users role row of the course as one json line, in the users role report order
+    """
+    course_key = CourseKey.from_string(course_id)
+    chunk_size = getattr(settings, 'CMM_API_REPORT_CHUNK_SIZE', 2000)
+    roster = get_roster([course_key], *get_roster_search_filters(**search), role=role, is_enrolled=is_enrolled)
+    for x in roster.iterator(chunk_size=chunk_size):
+        yield json.dumps(get_roster_row(x)) + '\n'
+
+def get_user_courses(username=None, email=None, run=None, after_course_key=None, page_size=None):
+    """
+        Get a page of the courses where the user has role or active enrollment, ordered by course id.
+        One roster query filtered by the user, next_cursor points to the following page.
+    """
+    if page_size is None:
+        page_size = getattr(settings, 'CMM_API_ROSTER_PAGE_SIZE', 500)
+    filters = [get_user_lookup_filter(username=username, email=email, run=run)]
+    if after_course_key is not None:
+        filters.append(Q(course_id__gt=after_course_key))
+    rows = get_roster(None, *filters).order_by('course_id', 'username')[:page_size + 1]
+    courses = [
+        {
+            'course_id': str(x['course_id']),
+            'username': x['username'],
+            'email': x['email'],
+            'run': x['run'],
+            'rol': x['rol'],
+            'is_enrolled': x['is_enrolled'],
+        }
+        for x in rows
+    ]
+    next_cursor = None
+    if len(courses) > page_size:
+        courses = courses[:page_size]
+        next_cursor = encode_cursor('course', courses[-1]['course_id'])
+    return {
+        'courses': courses,
+        'next_cursor': next_cursor,
+    }
+
+def get_status_tasks(course_id, task_type=None, task_state=None, since=None, after_id=None, page_size=None):
+    """
+        Get the tasks in the course with url to download it, ordered by id (monotonic with created).
+        Without page_size and after_id all the tasks are returned, as before the pagination,
+        otherwise a page is returned and next_cursor points to the following page.
+    """
+    course_key = CourseKey.from_string(course_id)
+    paginate = page_size is not None or after_id is not None
+    if page_size is None:
+        page_size = getattr(settings, 'CMM_API_STATUS_PAGE_SIZE', 100)
+    tasks = InstructorTask.objects.filter(task_type__in=TASK_TYPES, course_id=course_key)
+    if task_type:
+        tasks = tasks.filter(task_type=task_type)
+    if task_state:
+        tasks = tasks.filter(task_state=task_state)
+    if since:
+        tasks = tasks.filter(updated__gte=since)
+    if after_id:
+        tasks = tasks.filter(id__gt=after_id)
+    list_task = tasks.order_by('id').values('id', 'task_type', 'task_id', 'task_state', 'task_output')
+    list_task = list(list_task[:page_size + 1] if paginate else list_task)
+    next_cursor = None
+    if paginate and len(list_task) > page_size:
+        list_task = list_task[:page_size]
+        next_cursor = encode_task_cursor(list_task[-1]['id'])
+    task_reports = {}
+    for x in list_task:
+        del x['id']
         try:
             task_output = json.loads(x['task_output'])
-            if 'report_name' in task_output and task_output['report_name'] in list_task_download:
-                x['url'] = list_task_download[task_output['report_name']]
+            if 'report_name' in task_output:
+                task_reports[x['task_id']] = task_output['report_name']
         except Exception:
             logger.info("CMM-Api - Task output is not a dict type, task_id: {}".format(x['task_id']))
-        list_task.append(x)
+    list_task_download = get_report_urls(course_key, task_reports.values())
+    for x in list_task:
+        report_name = task_reports.get(x['task_id'])
+        if report_name in list_task_download:
+            x['url'] = list_task_download[report_name]
+            x['format'] = get_report_format(report_name)
     response_payload = {
-        'list_task':list_task
+        'list_task':list_task,
+        'next_cursor': next_cursor,
     }
     return response_payload
 
+def get_status_tasks_etag(course_id, **filters):
+    """
+        Cheap validator of get_status_tasks: last task update and number of tasks in the course plus the page filters.
+        It changes every CMM_API_STATUS_ETAG_MAX_AGE seconds so clients refresh the signed urls.
+    """
+    course_key = CourseKey.from_string(course_id)
+    tasks_state = InstructorTask.objects.filter(task_type__in=TASK_TYPES, course_id=course_key).aggregate(
+        last_updated=Max('updated'), total=Count('id'))
+    max_age = getattr(settings, 'CMM_API_STATUS_ETAG_MAX_AGE', 300)
+    validator = [
+        course_id,
+        str(tasks_state['last_updated']),
+        tasks_state['total'],
+        sorted((k, str(v)) for k, v in filters.items() if v is not None),
+        int(time() // max_age) if max_age else 0,
+    ]
+    return '"{}"'.format(hashlib.md5(json.dumps(validator).encode('utf-8')).hexdigest())
+
+def get_task_status(task_id):
+    """
+        Get the status of a CMM task with the url to download its report, None if it does not exist
+    """
+    task = InstructorTask.objects.filter(task_id=task_id, task_type__in=TASK_TYPES).values('course_id', 'task_type', 'task_id', 'task_state', 'task_output').first()
+    if task is None:
+        return None
+    course_key = task.pop('course_id')
+    try:
+        report_name = json.loads(task['task_output']).get('report_name')
+    except Exception:
+        report_name = None
+    if report_name:
+        urls = get_report_urls(course_key, [report_name])
+        if report_name in urls:
+            task['url'] = urls[report_name]
+            task['format'] = get_report_format(report_name)
+    return task
+
+def wait_task_status(task_id, last_state=None, timeout=0):
+    """
+        Wait until the task state is different from last_state (or until it finishes if last_state is None)
+        or the timeout is reached, only the task state is queried while waiting.
+    """
+    deadline = time() + timeout
+    interval = getattr(settings, 'CMM_API_TASK_WAIT_INTERVAL', 1)
+    while True:
+        task_state = InstructorTask.objects.filter(task_id=task_id, task_type__in=TASK_TYPES).values_list('task_state', flat=True).first()
+        if task_state is None:
+            return None
+        if task_state in READY_STATES or (last_state is not None and task_state != last_state):
+            break
+        if time() + interval > deadline:
+            break
+        sleep(interval)
+    return get_task_status(task_id)
+
+def iter_task_status_events(task_id, timeout):
+    """
+        Server-sent events with each state of the task until it finishes or the timeout is reached
+    """
+    deadline = time() + timeout
+    keep_alive = getattr(settings, 'CMM_API_TASK_WAIT_KEEP_ALIVE', 15)
+    task = get_task_status(task_id)
+    if task is not None:
+        yield 'event: status\ndata: {}\n\n'.format(json.dumps(task))
+    while task is not None and task['task_state'] not in READY_STATES and time() < deadline:
+        last_state = task['task_state']
+        task = wait_task_status(task_id, last_state=last_state, timeout=min(keep_alive, deadline - time()))
+        if task is not None and task['task_state'] != last_state:
+            yield 'event: status\ndata: {}\n\n'.format(json.dumps(task))
+        elif task is not None:
+            yield ': keep-alive\n\n'
+    if task is None:
+        yield 'event: error\ndata: {}\n\n'.format(json.dumps({'error': 'Task does not exist'}))
+
 def utils_export_ora2_data(request, course_id):
     """
     Pushes a Celery task which will aggregate ora2 responses for a course into a .csv
@@ -169,57 +504,134 @@ def utils_export_ora2_data(request, course_id):
         success_status = 'El reporte ORA2 está siendo creado.'
         return {"status": success_status, 'task_id': task.task_id}
     except AlreadyRunningError:
-        return {"status": 'Already Running Task'}
+        return get_running_task_response('cmmapi_export_ora2_data', get_ora2_task_key(course_key))
 
 def submit_export_ora2_data(request, course_key):
     """
     AlreadyRunningError is raised if an ora2 report is already being generated.
     """
     task_type = 'cmmapi_export_ora2_data'
-    task_class = export_ora2_data
     task_input = {}
-    task_key = "CMM-API-ORA2-REPORT-{}".format(str(course_key))
+    task_class = route_task(export_ora2_data, task_type, course_key, task_input)
+    task_key = get_ora2_task_key(course_key)
+    check_task_admission(task_type, task_key)
 
     return submit_task(request, task_type, task_class, course_key, task_input, task_key)
 
-def get_problem_responses(request, block_id):
+def get_problem_responses(request, block_ids):
     """
-        Generate Problem report task
+        Generate one Problem report task for a block id or a list of block ids of the same course,
+        subsections and units are expanded to their problems by the task
     """
+    if isinstance(block_ids, str):
+        block_ids = [block_ids]
     try:
-        task = submit_calculate_problem_responses_csv(request, block_id)
+        task = submit_calculate_problem_responses_csv(request, block_ids)
         success_status = 'El reporte Problem Responses está siendo creado.'
         return {"status": success_status, 'task_id': task.task_id}
     except AlreadyRunningError:
-        return {"status": 'Already Running Task'}
+        course_key = UsageKey.from_string(block_ids[0]).course_key
+        return get_running_task_response('cmmapi_problem_responses_csv', get_problem_task_key(course_key, block_ids))
 
-def submit_calculate_problem_responses_csv(request, problem_location):
+def submit_calculate_problem_responses_csv(request, problem_locations):
     """
     Submits a task to generate a CSV file containing all student
-    answers to a given problem.
+    answers to the given problems.
 
     Raises AlreadyRunningError if said file is already being updated.
     """
-    usage_key = UsageKey.from_string(problem_location)
+    course_key = UsageKey.from_string(problem_locations[0]).course_key
     task_type = 'cmmapi_problem_responses_csv'
-    task_class = calculate_problem_responses_csv
     task_input = {
-        'problem_locations': problem_location,
+        'problem_locations': ','.join(problem_locations),
         'problem_types_filter': None,
         'user_id': request.user.pk,
     }
-    task_key = "CMM-API-PROBLEM-REPORT-{}".format(str(usage_key.course_key))
+    task_class = route_task(calculate_problem_responses_csv, task_type, course_key, task_input)
+    task_key = get_problem_task_key(course_key, problem_locations)
+    check_task_admission(task_type, task_key)
 
-    return submit_task(request, task_type, task_class, usage_key.course_key, task_input, task_key)
+    return submit_task(request, task_type, task_class, course_key, task_input, task_key)
 
-def get_students_roles(request, course_id):
+def get_students_roles(request, course_id, force=False, sharded=False, since=None, output_format='csv'):
     """
-        Generate users role report
+        Generate users role report, only with the changes if since is given
     """
     course_key = CourseKey.from_string(course_id)
+    task_input = {}
+    if output_format != 'csv':
+        task_input['output_format'] = output_format
+    if since is not None:
+        task_input['since'] = since.isoformat()
+    elif sharded:
+        task_input['sharded'] = True
+    if not force:
+        recent_report = get_recent_report_response('cmmapi_student_data', course_key, task_input)
+        if recent_report is not None:
+            return recent_report
     try:
-        task = task_process_data(request, course_key)
+        task = task_process_data(request, course_key, task_input)
         success_status = 'El reporte Rol Usuarios está siendo creado.'
         return {"status": success_status, 'task_id': task.task_id}
     except AlreadyRunningError:
-        return {"status": 'Already Running Task'}
+        return get_running_task_response('cmmapi_student_data', get_student_data_task_key(course_key, task_input))
+
+def validate_courses(course_ids):
+    """
+        Split course ids in existing course keys and invalid ids with one CourseOverview query
+    """
+    from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+    course_keys = {}
+    invalid = []
+    for course_id in course_ids:
+        try:
+            course_keys[course_id] = CourseKey.from_string(course_id)
+        except InvalidKeyError:
+            logger.error("CMM-Api error validate course, invalid format: {}".format(course_id))
+            invalid.append(course_id)
+    existing = set(str(x) for x in CourseOverview.objects.filter(id__in=list(course_keys.values())).values_list('id', flat=True))
+    valid = []
+    for course_id, course_key in course_keys.items():
+        if str(course_key) in existing:
+            valid.append(course_id)
+            course_exists_cache.set(course_id, True)
+        else:
+            invalid.append(course_id)
+    return valid, invalid
+
+BULK_REPORTS = {
+    'student-profile': lambda request, course_id, force: get_students_features(request, course_id, force=force),
+    'ora2-report': lambda request, course_id, force: utils_export_ora2_data(request, course_id),
+    'users-role-report': lambda request, course_id, force: get_students_roles(request, course_id, force=force),
+}
+
+def submit_bulk_reports(request, course_ids, report_type, force=False):
+    """
+        Submit the same report for many courses, returns the result of each course
+    """
+    valid, invalid = validate_courses(course_ids)
+    results = {}
+    for course_id in invalid:
+        results[course_id] = {"status": 'Invalid Course', 'error': u"Course key not valid or dont exists: {}".format(course_id)}
+    rejected = None
+    for course_id in valid:
+        if rejected is None:
+            try:
+                results[course_id] = BULK_REPORTS[report_type](request, course_id, force)
+                continue
+            except TaskAdmissionError as e:
+                # the backlog will not go down while the request runs, reject the remaining courses
+                rejected = dict(e.detail, status='Rejected')
+        results[course_id] = rejected
+    return {'results': results}
+
+def get_org_students_roles(request, org, course_ids=None, output_format='csv'):
+    """
+        Generate one users role report for every course of the org, or for course_ids
+    """
+    try:
+        task = task_process_org_data(request, org, course_ids, output_format)
+        success_status = 'El reporte Rol Usuarios de la organización está siendo creado.'
+        return {"status": success_status, 'task_id': task.task_id}
+    except AlreadyRunningError:
+        return get_running_task_response('cmmapi_org_student_data', get_org_student_data_task_key(org, course_ids or [], output_format))
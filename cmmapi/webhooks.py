@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.http.request import validate_host
+from django.utils import timezone
+from celery import task
+from celery.states import READY_STATES
+from lms.djangoapps.instructor_task.models import InstructorTask
+from .models import CMMTaskWebhook
+from collections import defaultdict
+from datetime import timedelta
+from urllib.parse import urlparse
+from uuid import uuid4
+from time import time
+import requests
+import logging
+import json
+import math
+
+logger = logging.getLogger(__name__)
+DELIVERY_SCHEDULE_KEY = 'cmmapi.webhooks.next_delivery'
+
+def is_callback_url_allowed(url):
+    """
+        Callback urls must use a scheme of CMM_API_WEBHOOK_ALLOWED_SCHEMES and a host of CMM_API_WEBHOOK_ALLOWED_HOSTS
+        (same patterns than ALLOWED_HOSTS), workers only POST the reports to trusted hosts. No hosts rejects every url.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in getattr(settings, 'CMM_API_WEBHOOK_ALLOWED_SCHEMES', ['https']):
+        return False
+    return bool(parsed.hostname) and validate_host(parsed.hostname, getattr(settings, 'CMM_API_WEBHOOK_ALLOWED_HOSTS', []))
+
+def register_task_webhook(task_id, callback_url):
+    """
+        Register a callback url for the task, if the task already finished it is notified right away
+    """
+    CMMTaskWebhook.objects.create(task_id=task_id, url=callback_url)
+    entry_id = InstructorTask.objects.filter(task_id=task_id, task_state__in=READY_STATES).values_list('id', flat=True).first()
+    if entry_id is not None:
+        notify_task_webhooks(entry_id)
+
+def notify_task_webhooks(entry_id):
+    """
+        Queue the delivery of the webhooks of a finished task
+    """
+    from .utils import get_task_status, TASK_TYPES
+    entry = InstructorTask.objects.filter(pk=entry_id).values('task_id', 'task_type', 'task_state').first()
+    if entry is None or entry['task_type'] not in TASK_TYPES or entry['task_state'] not in READY_STATES:
+        return
+    if not CMMTaskWebhook.objects.filter(task_id=entry['task_id'], state=CMMTaskWebhook.WAITING).exists():
+        return
+    event = get_task_status(entry['task_id'])
+    event.pop('task_output', None)
+    # only WAITING rows are updated so concurrent notifications do not duplicate the event
+    updated = CMMTaskWebhook.objects.filter(task_id=entry['task_id'], state=CMMTaskWebhook.WAITING).update(
+        state=CMMTaskWebhook.PENDING,
+        payload=json.dumps(event),
+        next_attempt=timezone.now())
+    if updated:
+        # wait a little so events finished close together are posted in one request
+        schedule_webhook_delivery(getattr(settings, 'CMM_API_WEBHOOK_BATCH_DELAY', 5))
+
+def schedule_webhook_delivery(countdown):
+    """
+        Queue deliver_task_webhooks in countdown seconds unless a delivery is already queued before that,
+        the last queued delivery is saved in CMM_API_WEBHOOK_CACHE so only one delivery chain is kept
+    """
+    cache = caches[getattr(settings, 'CMM_API_WEBHOOK_CACHE', 'default')]
+    eta = time() + countdown
+    scheduled = cache.get(DELIVERY_SCHEDULE_KEY)
+    if scheduled is not None and scheduled[1] <= eta:
+        return
+    token = str(uuid4())
+    cache.set(DELIVERY_SCHEDULE_KEY, (token, eta), timeout=math.ceil(countdown) + 60)
+    deliver_task_webhooks.apply_async(args=(token,), countdown=countdown)
+
+def deliver_pending_webhooks():
+    """
+        Post the pending events grouped by url, failed deliveries are retried with exponential backoff.
+        Returns the seconds until the next retry, or None if nothing is pending.
+    """
+    now = timezone.now()
+    timeout = getattr(settings, 'CMM_API_WEBHOOK_TIMEOUT', 5)
+    max_attempts = getattr(settings, 'CMM_API_WEBHOOK_MAX_ATTEMPTS', 5)
+    backoff = getattr(settings, 'CMM_API_WEBHOOK_BACKOFF', 30)
+    due = CMMTaskWebhook.objects.filter(state=CMMTaskWebhook.PENDING, next_attempt__lte=now)
+    due_ids = list(due.values_list('id', flat=True)[:getattr(settings, 'CMM_API_WEBHOOK_BATCH_SIZE', 500)])
+    # claim the rows so a concurrent delivery does not post them again
+    lease = now + timedelta(seconds=timeout * 2)
+    CMMTaskWebhook.objects.filter(id__in=due_ids, state=CMMTaskWebhook.PENDING, next_attempt__lte=now).update(next_attempt=lease)
+    by_url = defaultdict(list)
+    for webhook in CMMTaskWebhook.objects.filter(id__in=due_ids, next_attempt=lease):
+        by_url[webhook.url].append(webhook)
+    for url, webhooks in by_url.items():
+        ids = [x.id for x in webhooks]
+        try:
+            response = requests.post(url, json={'events': [json.loads(x.payload) for x in webhooks]}, timeout=timeout, allow_redirects=False)
+            # a redirect could send the events to a host that is not allowed, it is not followed
+            if 300 <= response.status_code < 400:
+                raise requests.HTTPError("Redirect not followed: {}".format(response.status_code), response=response)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning("CMMApi - Webhook delivery failed, url: {}, error: {}".format(url, e))
+            attempts = max(x.attempts for x in webhooks) + 1
+            CMMTaskWebhook.objects.filter(id__in=ids).update(
+                attempts=F('attempts') + 1,
+                next_attempt=timezone.now() + timedelta(seconds=backoff * 2 ** (attempts - 1)))
+            CMMTaskWebhook.objects.filter(id__in=ids, attempts__gte=max_attempts).update(state=CMMTaskWebhook.FAILED)
+        else:
+            CMMTaskWebhook.objects.filter(id__in=ids).update(state=CMMTaskWebhook.DELIVERED, attempts=F('attempts') + 1)
+    next_attempt = CMMTaskWebhook.objects.filter(state=CMMTaskWebhook.PENDING).order_by('next_attempt').values_list('next_attempt', flat=True).first()
+    if next_attempt is None:
+        return None
+    return max((next_attempt - timezone.now()).total_seconds(), 0)
+
+@task(queue='edx.lms.core.low')
+def deliver_task_webhooks(token=None):
+    cache = caches[getattr(settings, 'CMM_API_WEBHOOK_CACHE', 'default')]
+    scheduled = cache.get(DELIVERY_SCHEDULE_KEY)
+    if scheduled is not None and scheduled[0] != token:
+        # an earlier delivery was queued after this one, that one keeps the chain
+        return
+    cache.delete(DELIVERY_SCHEDULE_KEY)
+    retry_in = deliver_pending_webhooks()
+    if retry_in is not None:
+        schedule_webhook_delivery(retry_in)
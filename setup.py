@@ -23,13 +23,15 @@ setup(
     description=".",
     packages=['cmmapi'],
     install_requires=["unidecode>=1.1.1"],
+    extras_require={"zstd": ["zstandard"]},
     classifiers=[
         "Programming Language :: Python :: 2",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
     entry_points={
-        "lms.djangoapp": ["cmmapi = cmmapi.apps:CMMAPIConfig"]
+        "lms.djangoapp": ["cmmapi = cmmapi.apps:CMMAPIConfig"],
+        "cms.djangoapp": ["cmmapi = cmmapi.apps:CMMAPIConfig"]
     },
     package_data=package_data("cmmapi", ["static", "public"]),
 )